@@ -0,0 +1,303 @@
+# check_message yo'lini oflayn o'lchash uchun replay benchmark.
+#
+# Yozib olingan (Bot API JSON, har qatorda bitta update) yoki sintetik update'lar
+# TelegramModerator orqali o'tkaziladi. Bot o'rniga chaqiruvlarni sanaydigan va API
+# kechikishini taqlid qiladigan stub ishlatiladi. Har bir so'zlar ro'yxati hajmi uchun
+# o'tkazuvchanlik, p50/p99 handler kechikishi, xabarga to'g'ri keladigan API chaqiruvlari
+# va xotira sarfi chiqariladi. Har bir hajm alohida jarayonda o'lchanadi, shuning uchun
+# max RSS o'sha hajmning o'ziga tegishli.
+#
+#   python benchmark.py
+#   python benchmark.py --sizes 1000,10000 --messages 20000 --latency-ms 30
+#   python benchmark.py --corpus updates.jsonl
+#   python benchmark.py --latency-ms 50 --concurrency 64   # ChatOrderedUpdateProcessor orqali
+#   python benchmark.py --fuzzy --sizes 1000,10000,100000   # taxminiy moslik narxi
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import string
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from telegram import Update
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+WORDS = ['salom', 'qalaysiz', 'bugun', 'guruh', 'yangilik', 'rahmat', 'kitob', 'dars', 'savol', 'javob',
+         'ertaga', 'uchrashuv', 'narx', 'sotiladi', 'manzil', 'telefon', 'yaxshi', 'zo‘r', 'video', 'rasm']
+LINKS = ['https://youtu.be/dQw4w9WgXcQ', 'https://www.youtube.com/watch?v=abc', 'https://spam.example/promo',
+         'www.casino.example', 'https://t.me/joinchat/abc']
+
+
+class StubBot:
+    # Bot API o'rniga: chaqiruvlarni sanaydi va tarmoq kechikishini taqlid qiladi
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call('getChatMember')
+        return SimpleNamespace(status='member', user=SimpleNamespace(id=user_id))
+
+    async def get_chat_administrators(self, chat_id):
+        await self._call('getChatAdministrators')
+        return [SimpleNamespace(status='creator', user=SimpleNamespace(id=1))]
+
+    async def delete_message(self, chat_id, message_id):
+        await self._call('deleteMessage')
+        return True
+
+    async def delete_messages(self, chat_id, message_ids):
+        await self._call('deleteMessages')
+        return True
+
+
+def misspell(word, rng):
+    # Bitta tahrir: qo'shish, o'chirish, almashtirish yoki qo'shni harflarni joyini almashtirish
+    i = rng.randrange(len(word))
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+    if kind == 1 and len(word) > 1:
+        return word[:i] + word[i + 1:]
+    if kind == 2:
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    if i + 1 < len(word):
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def random_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+
+def make_word_list(size, seed):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(random_word(rng))
+    return sorted(words)
+
+
+def synthetic_corpus(count, offensive_words, seed, chats=20, users=500, typos=False):
+    rng = random.Random(seed)
+    updates = []
+    message_id = 0
+    while len(updates) < count:
+        message_id += 1
+        # Har bir foydalanuvchi asosan bitta guruhda yozadi
+        user_id = 1000 + rng.randrange(users)
+        chat_id = -1000000000000 - user_id % chats
+        message = {
+            'message_id': message_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'supergroup'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+        }
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+        kind = rng.random()
+        if kind < 0.05:
+            word = rng.choice(offensive_words)
+            # --fuzzy: haqoratli so'zlarning yarmi bitta harf xatosi bilan yoziladi
+            text += ' ' + (misspell(word, rng) if typos and rng.random() < 0.5 else word)
+        elif kind < 0.12:
+            link = rng.choice(LINKS)
+            text += ' ' + link
+            message['entities'] = [{'type': 'url', 'offset': len(text) - len(link), 'length': len(link)}]
+        elif kind < 0.15:
+            text += ' @spam_channel'
+        elif kind < 0.17:
+            message['document'] = {'file_id': 'f', 'file_unique_id': 'u',
+                                   'file_name': rng.choice(['app.apk', 'hujjat.pdf'])}
+            message['caption'] = text
+            text = None
+        elif kind < 0.22:
+            # 2-5 elementli albom, izoh faqat birinchisida
+            group_id = f'album{message_id}'
+            caption = text + (' ' + rng.choice(offensive_words) if rng.random() < 0.3 else '')
+            for index in range(rng.randint(2, 5)):
+                item = dict(message, message_id=message_id, media_group_id=group_id,
+                            photo=[{'file_id': 'p', 'file_unique_id': 'p', 'width': 1, 'height': 1}])
+                if index == 0:
+                    item['caption'] = caption
+                updates.append({'update_id': message_id, 'message': item})
+                message_id += 1
+            continue
+        if text is not None:
+            message['text'] = text
+        updates.append({'update_id': message_id, 'message': message})
+    return updates[:count]
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_size(main3, size, corpus, args, workdir):
+    db_path = os.path.join(workdir, f'bench_{size}.db')
+    main3.AUTOMATON_SNAPSHOT = os.path.join(workdir, f'bench_{size}.pkl')
+    # Korpus bir zumda qayta o'ynaladi, shuning uchun flood chegaralari o'chiriladi:
+    # bosqich har bir xabarda ishlaydi, lekin natijalar oldingi o'lchovlar bilan solishtiriladigan qoladi
+    main3.FLOOD_MAX_MESSAGES = main3.DUPLICATE_MAX_COPIES = len(corpus) + 1
+    word_manager = main3.OffensiveWordManager(db_path=db_path)
+    offensive_words = make_word_list(size, args.seed)
+    word_manager.add_words(offensive_words)
+
+    bot = StubBot(args.latency_ms / 1000)
+    application = SimpleNamespace(bot=bot, job_queue=None)
+    started = time.perf_counter()
+    moderator = main3.TelegramModerator('benchmark', application, word_manager=word_manager)
+    startup_ms = (time.perf_counter() - started) * 1000
+    # Benchmark handler yo'lini o'lchaydi; o'chirish navbatining tezlik cheklovi o'chiriladi
+    moderator.actions = main3.ModerationActionQueue(bot, global_rate=1e9, chat_rate=1e9)
+    context = SimpleNamespace(bot=bot, job_queue=None)
+
+    updates = [Update.de_json(data, None) for data in corpus]
+    latencies = []
+    processed = {}
+
+    async def handle(update):
+        processed.setdefault(update.effective_chat.id, []).append(update.update_id)
+        handler_started = time.perf_counter()
+        await moderator.check_message(update, context)
+        latencies.append(time.perf_counter() - handler_started)
+
+    replay_started = time.perf_counter()
+    if args.concurrency > 1:
+        # Application bilan bir xil: har bir update uchun vazifa, kelish tartibida yaratiladi
+        processor = main3.ChatOrderedUpdateProcessor(args.concurrency)
+        await asyncio.gather(*[
+            asyncio.create_task(processor.process_update(update, handle(update))) for update in updates
+        ])
+    else:
+        for update in updates:
+            await handle(update)
+    replay_seconds = time.perf_counter() - replay_started
+    expected = {}
+    for update in updates:
+        expected.setdefault(update.effective_chat.id, []).append(update.update_id)
+    order_violations = sum(1 for chat_id, ids in expected.items() if processed.get(chat_id) != ids)
+    await moderator.actions.close()
+    await moderator.audit.flush()
+
+    # Faqat so'z skanerlash bosqichi: aniq automaton va fuzzy indeks bilan
+    fuzzy = {}
+    if args.fuzzy:
+        texts = [update.message.text or update.message.caption for update in updates]
+        texts = [text for text in texts if text]
+        build_started = time.perf_counter()
+        fuzzy_index = moderator._build_fuzzy_index(moderator.A)
+        fuzzy['build_ms'] = (time.perf_counter() - build_started) * 1000
+        fuzzy['keys'] = len(fuzzy_index)
+        for label, index in (('exact', None), ('fuzzy', fuzzy_index)):
+            moderator.fuzzy_index = index
+            scan_started = time.perf_counter()
+            fuzzy[f'{label}_found'] = sum(1 for text in texts if moderator._contains_offensive_words(text))
+            fuzzy[f'{label}_us'] = (time.perf_counter() - scan_started) / len(texts) * 1e6
+
+    latencies.sort()
+    automaton_stats = moderator.A.get_stats() if len(moderator.A) else {'total_size': 0}
+    word_manager.close()
+    return {
+        'words': size,
+        'startup_ms': startup_ms,
+        'msgs_per_s': len(updates) / replay_seconds if replay_seconds else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'api_per_msg': sum(bot.calls.values()) / len(updates),
+        'calls': dict(bot.calls),
+        'deleted': moderator.actions.deleted,
+        'order_violations': order_violations,
+        'automaton_mb': automaton_stats['total_size'] / 2 ** 20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'fuzzy': fuzzy,
+    }
+
+
+def print_report(results, messages, concurrency):
+    print(f"\n{messages} ta xabar replay qilindi (parallel: {concurrency})")
+    header = f"{'so`zlar':>8} {'start ms':>9} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'API/msg':>8} {'o`chirildi':>10} {'automaton MB':>13} {'max RSS MB':>11}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['words']:>8} {r['startup_ms']:>9.1f} {r['msgs_per_s']:>9.0f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} "
+              f"{r['api_per_msg']:>8.3f} {r['deleted']:>10} {r['automaton_mb']:>13.1f} {r['max_rss_mb']:>11.1f}")
+    for r in results:
+        print(f"  {r['words']:>8} so'z: {r['calls']}, chat tartibi buzilgan chatlar: {r['order_violations']}")
+    if results and results[0]['fuzzy']:
+        print("\nSo'z skanerlash narxi (xabarga, mikrosekund)")
+        header = f"{'so`zlar':>8} {'indeks kaliti':>14} {'qurish ms':>10} {'aniq us':>8} {'fuzzy us':>9} {'aniq topildi':>13} {'fuzzy topildi':>14}"
+        print(header)
+        print('-' * len(header))
+        for r in results:
+            f = r['fuzzy']
+            print(f"{r['words']:>8} {f['keys']:>14} {f['build_ms']:>10.1f} {f['exact_us']:>8.1f} {f['fuzzy_us']:>9.1f} "
+                  f"{f['exact_found']:>13} {f['fuzzy_found']:>14}")
+
+
+def bench_size(size, args, workdir):
+    # Yangi jarayonda ishlaydi: ru_maxrss faqat shu hajm uchun o'lchanadi
+    # main3 import paytida bot.log'ni joriy papkada ochadi - benchmark loglari vaqtinchalik papkaga yoziladi
+    os.chdir(workdir)
+    import main3
+    if args.fuzzy:
+        main3.FUZZY_MATCH = True
+        main3.FUZZY_MAX_DISTANCE = args.fuzzy_distance
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = synthetic_corpus(args.messages, make_word_list(size, args.seed), args.seed, typos=args.fuzzy)
+    result = asyncio.run(run_size(main3, size, corpus, args, workdir))
+    result['messages'] = len(corpus)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="check_message uchun replay benchmark")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="so'zlar ro'yxati hajmlari (vergul bilan)")
+    parser.add_argument('--messages', type=int, default=10000, help="sintetik xabarlar soni")
+    parser.add_argument('--corpus', help="Bot API update'lari yozilgan JSONL fayl (sintetik o'rniga)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="stub API chaqiruvi kechikishi")
+    parser.add_argument('--concurrency', type=int, default=1, help="parallel update'lar soni (1 - ketma-ket)")
+    parser.add_argument('--fuzzy', action='store_true', help="taxminiy moslikni yoqish va skanerlash narxini o'lchash")
+    parser.add_argument('--fuzzy-distance', type=int, default=1, help="fuzzy rejimda ruxsat etilgan tahrir masofasi")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    # Nisbiy yo'l joriy papkaga nisbatan; ishchi jarayonlar vaqtinchalik papkaga o'tadi
+    if args.corpus:
+        args.corpus = os.path.abspath(args.corpus)
+
+    workdir = tempfile.mkdtemp(prefix='moderator_bench_')
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in [int(value) for value in args.sizes.split(',') if value]:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(bench_size, size, args, workdir).result())
+    print_report(results, results[-1]['messages'] if results else 0, args.concurrency)
+    print(f"\nVaqtinchalik fayllar: {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,38 +2,506 @@ import os
 import sqlite3
 import logging
 import re
+import unicodedata
+import pickle
 from datetime import datetime, timedelta
 import asyncio
 import functools
+import operator
+import threading
+import contextlib
+import time
+import tempfile
+import json
+import hashlib
+import queue
+import random
+import atexit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from collections import OrderedDict, deque
 import ahocorasick
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Chat
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Chat, MessageEntity
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    filters, ContextTypes, JobQueue
+    ChatMemberHandler, filters, ContextTypes, JobQueue, BaseUpdateProcessor
 )
 from dotenv import load_dotenv
 from telegram.ext.filters import Sticker
+from telegram.error import BadRequest, NetworkError, RetryAfter
 
 # --- Konfiguratsiya va Logging ---
 load_dotenv()
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'default_token')
 OWNER_ID = int(os.getenv('OWNER_ID', 0))
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # 'polling' yoki 'webhook'
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 64))  # 1 - update'lar ketma-ket
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', '1') == '1'
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+MEMBER_CACHE_TTL = int(os.getenv('MEMBER_CACHE_TTL', 300))
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', 50000))
+REBUILD_DEBOUNCE = float(os.getenv('REBUILD_DEBOUNCE', 1.0))
+AUTOMATON_SNAPSHOT = os.getenv('AUTOMATON_SNAPSHOT', 'automaton.pkl')
+WORD_SYNC_INTERVAL = float(os.getenv('WORD_SYNC_INTERVAL', 5.0))  # 0 - boshqa jarayonlar kuzatilmaydi
+WORD_SYNC_BATCH = 5000
+WORD_CHANGES_KEEP = int(os.getenv('WORD_CHANGES_KEEP', 100000))
+FUZZY_MATCH = os.getenv('FUZZY_MATCH', '0') == '1'
+FUZZY_MAX_DISTANCE = int(os.getenv('FUZZY_MAX_DISTANCE', 1))
+FUZZY_MIN_LENGTH = int(os.getenv('FUZZY_MIN_LENGTH', 5))  # qisqa so'zlarda xato moslik ehtimoli katta
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 5 * 1024 * 1024))
+DELETE_GLOBAL_RATE = float(os.getenv('DELETE_GLOBAL_RATE', 25))
+DELETE_CHAT_RATE = float(os.getenv('DELETE_CHAT_RATE', 3))
+DELETE_MAX_IN_FLIGHT = int(os.getenv('DELETE_MAX_IN_FLIGHT', 8))
+DELETE_MAX_RETRIES = int(os.getenv('DELETE_MAX_RETRIES', 5))
+DELETE_BATCH_SIZE = 100  # deleteMessages chegarasi
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 5.0))
+AUDIT_FLUSH_SIZE = int(os.getenv('AUDIT_FLUSH_SIZE', 500))
+AUDIT_MAX_BUFFER = int(os.getenv('AUDIT_MAX_BUFFER', 50000))
+MEDIA_GROUP_TTL = int(os.getenv('MEDIA_GROUP_TTL', 60))
+MEDIA_GROUP_MAX_ENTRIES = int(os.getenv('MEDIA_GROUP_MAX_ENTRIES', 5000))
+MEDIA_GROUP_MAX_MESSAGES = 20  # albomda 10 tagacha element bo'ladi
+CHAT_POLICY_CACHE_SIZE = int(os.getenv('CHAT_POLICY_CACHE_SIZE', 512))
+DEFAULT_BLOCKED_EXTENSIONS = ('.apk',)
+FLOOD_WINDOW = int(os.getenv('FLOOD_WINDOW', 10))
+FLOOD_MAX_MESSAGES = int(os.getenv('FLOOD_MAX_MESSAGES', 8))
+FLOOD_BLOCK_SECONDS = int(os.getenv('FLOOD_BLOCK_SECONDS', 30))
+DUPLICATE_WINDOW = int(os.getenv('DUPLICATE_WINDOW', 300))
+DUPLICATE_MAX_COPIES = int(os.getenv('DUPLICATE_MAX_COPIES', 3))
+DUPLICATE_MIN_LENGTH = int(os.getenv('DUPLICATE_MIN_LENGTH', 24))  # "ok", "rahmat" kabi qisqa javoblar hisobga olinmaydi
+DUPLICATE_MIN_SIMILARITY = float(os.getenv('DUPLICATE_MIN_SIMILARITY', 0.5))  # MinHash bo'yicha taxminiy Jaccard o'xshashligi
+FLOOD_HISTORY = 32  # foydalanuvchi bo'yicha saqlanadigan oxirgi xabarlar soni
+FLOOD_MAX_USERS = int(os.getenv('FLOOD_MAX_USERS', 20000))
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' yoki 'text'
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # masalan 'midnight' - hajm o'rniga vaqt bo'yicha aylantirish
+HOT_LOG_SAMPLE_RATE = float(os.getenv('HOT_LOG_SAMPLE_RATE', 1.0))
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', 20000))
+VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', 600))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # 0 - HTTP endpoint o'chirilgan
+METRICS_MAX_CHATS = int(os.getenv('METRICS_MAX_CHATS', 500))
+ALLOWED_LINKS = [
+    link.strip() for link in
+    os.getenv('ALLOWED_LINKS', 'youtube.com/watch,youtu.be/,youtube.com/shorts,m.youtube.com').split(',')
+    if link.strip()
+]
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    filename='bot.log'
-)
+class JsonFormatter(logging.Formatter):
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._reserved:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    # Bot tokeni (masalan, httpx so'rov URL'larida) faylga yozilmaydi
+    def __init__(self, formatter, secrets):
+        super().__init__()
+        self.formatter = formatter
+        self.secrets = [secret for secret in secrets if secret and len(secret) > 8]
+
+    def format(self, record):
+        text = self.formatter.format(record)
+        for secret in self.secrets:
+            text = text.replace(secret, '<TOKEN>')
+        return text
+
+
+class PollingNoiseFilter(logging.Filter):
+    # Har ~10 soniyadagi httpx "getUpdates" INFO qatorlarini tashlab yuboradi
+    def filter(self, record):
+        return record.levelno > logging.INFO or 'getUpdates' not in record.getMessage()
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    # Standart prepare() xabarni event loop oqimida formatlaydi; biz yozuvni o'zgarishsiz
+    # navbatga qo'yamiz va formatlash/yozishni to'liq fon oqimiga qoldiramiz
+    def prepare(self, record):
+        return record
+
+
+def setup_logging():
+    if LOG_ROTATE_WHEN:
+        file_handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(RedactingFormatter(formatter, [TOKEN]))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    logging.getLogger('httpx').addFilter(PollingNoiseFilter())
+    logging.getLogger(f'{__name__}.hot').addFilter(SamplingFilter(HOT_LOG_SAMPLE_RATE))
+    listener.start()
+    atexit.register(listener.stop)
+
+
+setup_logging()
 logger = logging.getLogger(__name__)
+# Har bir xabar uchun yoziladigan qatorlar: HOT_LOG_SAMPLE_RATE bo'yicha tanlab yoziladi
+hot_logger = logging.getLogger(f'{__name__}.hot')
+
+# --- Metrics sinfi ---
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Bucket yuqori chegarasi bo'yicha taxminiy qiymat
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    # Jarayon ichidagi yengil metrikalar: bitta perf_counter ayirmasi + bisect, lock yo'q
+    # (hammasi event loop oqimida yangilanadi). Prometheus matn formatida chiqariladi.
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.callbacks = {}
+        self._chat_labels = set()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = self._key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def chat_label(self, chat_id):
+        # Chatlar soni cheksiz o'smasligi uchun birinchi METRICS_MAX_CHATS tasidan keyingilari "other"
+        if chat_id in self._chat_labels:
+            return str(chat_id)
+        if len(self._chat_labels) < METRICS_MAX_CHATS:
+            self._chat_labels.add(chat_id)
+            return str(chat_id)
+        return 'other'
+
+    def register(self, name, kind, func):
+        self.callbacks[name] = (kind, func)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(name, {}).get(self._key(labels))
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        escaped = []
+        for key, value in items:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{key}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        lines = []
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for name, (kind, func) in self.callbacks.items():
+            try:
+                value = func()
+            except Exception as e:
+                logger.warning(f"Metrika ({name}) qiymatini olishda xatolik: {e}")
+                continue
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while True:
+                header = await asyncio.wait_for(reader.readline(), timeout=5)
+                if header in (b'\r\n', b'\n', b''):
+                    break
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if path == '/metrics':
+                status, body = '200 OK', metrics.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Metrics so'rovini qayta ishlashda xatolik: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Metrics endpoint ishga tushdi: http://{host}:{port}/metrics")
+    return server
+
+# --- Matnni normallashtirish ---
+# Kirill/lotin aralashmasi, o'xshash harflar (homoglif), raqam bilan yozilgan harflar va
+# cho'zilgan harflarni bitta kanonik shaklga keltiradi. Saqlangan so'zlarga ham, kelgan
+# matnga ham bir xil qo'llanadi. Jadval o'zgarsa NORMALIZER_VERSION oshirilishi kerak.
+NORMALIZER_VERSION = 3
+
+_CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': "'", 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': "o'", 'қ': 'q', 'ғ': "g'", 'ҳ': 'h', 'і': 'i', 'ј': 'j', 'ѕ': 's',
+}
+_HOMOGLYPHS = {
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'μ': 'm', 'ν': 'v',
+    'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x', 'ԁ': 'd', 'ɡ': 'g', 'ı': 'i',
+    'ʻ': "'", 'ʼ': "'", '‘': "'", '’': "'", '`': "'", '´': "'",
+}
+_LEETSPEAK = {'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's'}
+_INVISIBLE = '\u00ad\u200b\u200c\u200d\u2060\ufeff'
+
+
+def _build_normalize_table():
+    table = {}
+    # Diakritikali lotin harflari (é, ö, ş ...) -> asosiy harf
+    for code in range(0x00C0, 0x0250):
+        base = unicodedata.decomposition(chr(code)).split(' ')[0]
+        if base and not base.startswith('<'):
+            base_char = chr(int(base, 16)).lower()
+            if base_char.isascii() and base_char.isalpha():
+                table[code] = base_char
+    # To'liq kenglikdagi (fullwidth) lotin harflari va raqamlar
+    for offset in range(26):
+        table[0xFF41 + offset] = chr(ord('a') + offset)
+    for offset in range(10):
+        table[0xFF10 + offset] = str(offset)
+    for mapping in (_CYRILLIC_TO_LATIN, _HOMOGLYPHS, _LEETSPEAK):
+        table.update({ord(char): value for char, value in mapping.items()})
+    for code in range(0xFF10, 0xFF1A):
+        table[code] = _LEETSPEAK.get(table[code], table[code])
+    table.update({ord(char): None for char in _INVISIBLE})
+    # str.lower() butun satrda so'z oxiridagi 'Σ' ni 'ς' ga, alohida belgida esa 'σ' ga aylantiradi;
+    # ikkalasini bitta shaklga keltiramiz, aks holda offsetlar normalize_text bilan mos kelmaydi
+    table[ord('ς')] = 'σ'
+    return table
+
+
+_NORMALIZE_TABLE = _build_normalize_table()
+# Faqat 3 va undan ortiq takrorlangan harf cho'zilgan deb hisoblanadi: o'zbek tilida qo'sh harfli
+# so'zlar ko'p (katta, ammo, ikki), ularni qisqartirish 'pass' -> 'pas' kabi oddiy so'zlarni qo'shib yuboradi
+_REPEAT_PATTERN = re.compile(r'(\w)\1{2,}')
+
+
+def normalize_text(text):
+    return _REPEAT_PATTERN.sub(r'\1', text.lower().translate(_NORMALIZE_TABLE))
+
+
+def normalize_with_offsets(text):
+    # normalize_text bilan bir xil natija + har bir normallashgan belgining asl matndagi indeksi.
+    # Faqat moslik topilganda chaqiriladi, shuning uchun oddiy xabarlarga qo'shimcha xarajat yo'q.
+    pieces = []
+    offsets = []
+    for index, char in enumerate(text):
+        out = char.lower().translate(_NORMALIZE_TABLE)
+        pieces.append(out)
+        offsets.extend([index] * len(out))
+    lowered = ''.join(pieces)
+    # Cho'zilgan harflar normalize_text'dagi aynan o'sha regex bilan qisqartiriladi
+    kept = []
+    position = 0
+    for match in _REPEAT_PATTERN.finditer(lowered):
+        kept.extend(offsets[position:match.start() + 1])
+        position = match.end()
+    kept.extend(offsets[position:])
+    return _REPEAT_PATTERN.sub(r'\1', lowered), kept
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+# --- FuzzyIndex sinfi ---
+def _deletes(word, max_distance):
+    # So'zning o'zi va max_distance tagacha harf o'chirilgan barcha variantlari
+    variants = {word}
+    layer = {word}
+    for _ in range(max_distance):
+        layer = {variant[:i] + variant[i + 1:] for variant in layer if len(variant) > 1 for i in range(len(variant))}
+        variants |= layer
+    return variants
+
+
+def edit_distance(a, b, max_distance):
+    # Damerau-Levenshtein (OSA); max_distance'dan oshsa max_distance + 1 qaytariladi
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class FuzzyIndex:
+    # SymSpell uslubidagi indeks: har bir so'zning o'chirishlar qo'shnichiligi xeshi -> so'z(lar).
+    # Matndagi so'zning o'chirish variantlari indeksdan qidiriladi, nomzodlar esa aniq masofa
+    # bilan tekshiriladi - lug'atdagi har bir so'z bilan solishtirilmaydi.
+    def __init__(self, words, max_distance=FUZZY_MAX_DISTANCE, min_length=FUZZY_MIN_LENGTH):
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.max_length = 0
+        self.words = 0
+        self._index = {}
+        for word in words:
+            if len(word) < min_length or not _WORD_PATTERN.fullmatch(word):
+                continue
+            self.words += 1
+            self.max_length = max(self.max_length, len(word))
+            for variant in _deletes(word, max_distance):
+                key = hash(variant)
+                existing = self._index.get(key)
+                if existing is None:
+                    self._index[key] = word
+                elif isinstance(existing, str):
+                    if existing != word:
+                        self._index[key] = (existing, word)
+                elif word not in existing:
+                    self._index[key] = existing + (word,)
+
+    def __len__(self):
+        return len(self._index)
+
+    def find(self, normalized, excluded=()):
+        # (matndagi so'z, lug'atdagi so'z) yoki None
+        index = self._index
+        min_length = self.min_length - self.max_distance
+        max_length = self.max_length + self.max_distance
+        for token in dict.fromkeys(_WORD_PATTERN.findall(normalized)):
+            if not min_length <= len(token) <= max_length:
+                continue
+            for variant in _deletes(token, self.max_distance):
+                candidates = index.get(hash(variant))
+                if candidates is None:
+                    continue
+                for candidate in (candidates,) if isinstance(candidates, str) else candidates:
+                    if candidate not in excluded and edit_distance(token, candidate, self.max_distance) <= self.max_distance:
+                        return token, candidate
+        return None
 
 # --- OffensiveWordManager sinfi ---
 class OffensiveWordManager:
     def __init__(self, db_path='bot_data.db'):
         self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+        # Barcha DB so'rovlari shu bitta oqimda bajariladi, event loop bloklanmaydi
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
         self._create_tables()
 
+    @contextlib.contextmanager
     def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+        # Bitta doimiy ulanish (WAL rejimi); blok tugaganda tranzaksiya commit/rollback qilinadi
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute("PRAGMA busy_timeout=5000")
+            with self._conn:
+                yield self._conn
+
+    def run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     def _create_tables(self):
         try:
@@ -46,6 +514,122 @@ class OffensiveWordManager:
                         added_at DATETIME
                     )
                 ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS meta (
+                        key TEXT PRIMARY KEY,
+                        value INTEGER
+                    )
+                ''')
+                cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('words_version', 0)")
+                cursor.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('word_count', (SELECT COUNT(*) FROM offensive_words))"
+                )
+                # /showwords har sahifada COUNT(*) qilmasligi uchun so'zlar soni trigger orqali yuritiladi
+                for event, delta in (('INSERT', '+ 1'), ('DELETE', '- 1')):
+                    cursor.execute(f'''
+                        CREATE TRIGGER IF NOT EXISTS offensive_words_count_{event.lower()}
+                        AFTER {event} ON offensive_words
+                        BEGIN
+                            UPDATE meta SET value = value {delta} WHERE key = 'word_count';
+                        END
+                    ''')
+                # Chat sozlamalari: NULL - global qiymat ishlatiladi
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_policies (
+                        chat_id INTEGER PRIMARY KEY,
+                        allowed_links TEXT,
+                        blocked_extensions TEXT,
+                        block_stories INTEGER,
+                        block_mentions INTEGER,
+                        updated_at DATETIME
+                    )
+                ''')
+                # Chatga xos so'zlar: 'add' - qo'shimcha, 'exclude' - global ro'yxatdan chiqarilgan
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_words (
+                        chat_id INTEGER,
+                        word TEXT,
+                        mode TEXT CHECK (mode IN ('add', 'exclude')),
+                        added_at DATETIME,
+                        PRIMARY KEY (chat_id, word)
+                    )
+                ''')
+                # O'chirilgan har bir xabar uchun bitta yozuv (AuditLog orqali to'plab yoziladi)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS moderation_audit (
+                        id INTEGER PRIMARY KEY,
+                        created_at DATETIME,
+                        chat_id INTEGER,
+                        user_id INTEGER,
+                        message_id INTEGER,
+                        reason TEXT,
+                        matched TEXT
+                    )
+                ''')
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS moderation_audit_chat ON moderation_audit (chat_id, created_at)"
+                )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS moderation_audit_user ON moderation_audit (user_id, created_at)"
+                )
+                # So'zlar o'zgarishlari jurnali: bir xil bazadagi boshqa jarayonlar faqat o'zgargan
+                # so'zlarni qo'llaydi. Eski yozuvlar prune_word_changes bilan tozalanadi.
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS word_changes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        word TEXT,
+                        op TEXT CHECK (op IN ('add', 'remove')),
+                        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS offensive_words_changes_insert
+                    AFTER INSERT ON offensive_words
+                    BEGIN
+                        INSERT INTO word_changes (word, op) VALUES (NEW.word, 'add');
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS offensive_words_changes_delete
+                    AFTER DELETE ON offensive_words
+                    BEGIN
+                        INSERT INTO word_changes (word, op) VALUES (OLD.word, 'remove');
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS offensive_words_changes_update
+                    AFTER UPDATE OF word ON offensive_words WHEN OLD.word IS NOT NEW.word
+                    BEGIN
+                        INSERT INTO word_changes (word, op) VALUES (OLD.word, 'remove');
+                        INSERT INTO word_changes (word, op) VALUES (NEW.word, 'add');
+                    END
+                ''')
+                # Chat qoidalari o'zgarishlari jurnali: boshqa jarayonlar shu chatlarning keshini tozalaydi
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_policy_changes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        chat_id INTEGER,
+                        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                for table in ('chat_policies', 'chat_words'):
+                    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                        cursor.execute(f'''
+                            CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()}
+                            AFTER {event} ON {table}
+                            BEGIN
+                                INSERT INTO chat_policy_changes (chat_id) VALUES ({row}.chat_id);
+                            END
+                        ''')
+                # So'zlar ro'yxatidagi har qanday o'zgarish versiyani oshiradi (automaton snapshot'i uchun)
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    cursor.execute(f'''
+                        CREATE TRIGGER IF NOT EXISTS offensive_words_version_{event.lower()}
+                        AFTER {event} ON offensive_words
+                        BEGIN
+                            UPDATE meta SET value = value + 1 WHERE key = 'words_version';
+                        END
+                    ''')
                 conn.commit()
         except sqlite3.Error as e:
             logger.error(f"Jadval yaratishda xatolik: {e}")
@@ -65,37 +649,64 @@ class OffensiveWordManager:
             word = word.lower().strip()
             if not word:
                 return "error"
-            if self.word_exists(word):
-                return "exists"
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    "INSERT INTO offensive_words (word, added_at) VALUES (?, ?)",
+                    "INSERT INTO offensive_words (word, added_at) VALUES (?, ?) ON CONFLICT(word) DO NOTHING",
                     (word, datetime.now())
                 )
                 conn.commit()
-            return "added"
-        except sqlite3.IntegrityError:
-            logger.warning(f"'{word}' so'zini qo'shishda poyga holati yoki UNIQUE xatosi.")
-            return "exists"
+                return "added" if cursor.rowcount else "exists"
         except sqlite3.Error as e:
             logger.error(f"So'z qo'shishda xatolik: {e}")
             return "error"
 
+    def add_words(self, words):
+        words = {word.lower().strip() for word in words}
+        words.discard('')
+        if not words:
+            return 0
+        try:
+            now = datetime.now()
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO offensive_words (word, added_at) VALUES (?, ?)",
+                    [(word, now) for word in words]
+                )
+                conn.commit()
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"So'zlarni ommaviy qo'shishda xatolik: {e}")
+            return -1
+
     def remove_word(self, word):
         try:
             word = word.lower().strip()
-            if not self.word_exists(word):
-                return "not_found"
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM offensive_words WHERE word = ?", (word,))
                 conn.commit()
-            return "removed"
+                return "removed" if cursor.rowcount else "not_found"
         except sqlite3.Error as e:
             logger.error(f"So'zni o'chirishda xatolik: {e}")
             return "error"
 
+    def remove_words(self, words):
+        words = {word.lower().strip() for word in words}
+        words.discard('')
+        if not words:
+            return 0
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("DELETE FROM offensive_words WHERE word = ?", [(word,) for word in words])
+                conn.commit()
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"So'zlarni ommaviy o'chirishda xatolik: {e}")
+            return -1
+
     def get_words(self, limit=None):
         try:
             with self._get_connection() as conn:
@@ -109,16 +720,901 @@ class OffensiveWordManager:
             logger.error(f"So'zlarni olishda xatolik: {e}")
             return []
 
+    def get_words_with_state(self):
+        # So'zlar, versiya va jurnalning oxirgi id'si bitta o'qish tranzaksiyasida (bir-biriga mos)
+        try:
+            with self._get_connection() as conn:
+                conn.execute("BEGIN")
+                words = [row[0] for row in conn.execute("SELECT word FROM offensive_words")]
+                version, change_id = self._words_state(conn)
+                return words, version, change_id
+        except sqlite3.Error as e:
+            logger.error(f"So'zlarni olishda xatolik: {e}")
+            return [], None, 0
+
+    @staticmethod
+    def _words_state(conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'words_version'").fetchone()
+        change_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM word_changes").fetchone()[0]
+        return (row[0] if row else 0), change_id
+
+    def data_version(self):
+        # Boshqa ulanishlar commit qilgandagina o'zgaradi - arzon "o'zgarish bormi?" tekshiruvi
+        with self._get_connection() as conn:
+            return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def word_changes_since(self, after_id, limit):
+        # (versiya, jurnaldagi eng kichik id, [(id, so'z, op), ...]) - bitta o'qish tranzaksiyasida
+        try:
+            with self._get_connection() as conn:
+                conn.execute("BEGIN")
+                min_id = conn.execute("SELECT MIN(id) FROM word_changes").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT id, word, op FROM word_changes WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+                ).fetchall()
+                version = conn.execute("SELECT value FROM meta WHERE key = 'words_version'").fetchone()[0]
+                return version, min_id, rows
+        except sqlite3.Error as e:
+            logger.error(f"So'zlar o'zgarishlarini olishda xatolik: {e}")
+            return None, None, []
+
+    def chat_policy_change_id(self):
+        try:
+            with self._get_connection() as conn:
+                return conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_policy_changes").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Chat qoidalari jurnalini o'qishda xatolik: {e}")
+            return 0
+
+    def chat_policy_changes_since(self, after_id):
+        # (jurnaldagi eng kichik id, eng katta id, {chat_id, ...}) - bitta o'qish tranzaksiyasida
+        try:
+            with self._get_connection() as conn:
+                conn.execute("BEGIN")
+                min_id, max_id = conn.execute("SELECT MIN(id), MAX(id) FROM chat_policy_changes").fetchone()
+                chat_ids = {row[0] for row in conn.execute(
+                    "SELECT DISTINCT chat_id FROM chat_policy_changes WHERE id > ?", (after_id,)
+                )}
+                return min_id, max_id, chat_ids
+        except sqlite3.Error as e:
+            logger.error(f"Chat qoidalari o'zgarishlarini olishda xatolik: {e}")
+            return None, None, None
+
+    def prune_word_changes(self, keep):
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(
+                    "DELETE FROM word_changes WHERE id <= (SELECT MAX(id) FROM word_changes) - ?", (keep,)
+                )
+                conn.execute(
+                    "DELETE FROM chat_policy_changes WHERE id <= (SELECT MAX(id) FROM chat_policy_changes) - ?", (keep,)
+                )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"So'zlar jurnalini tozalashda xatolik: {e}")
+            return 0
+
+    def get_words_page(self, limit, after_id=None, before_id=None):
+        # Keyset pagination: id bo'yicha indeksdan faqat bitta sahifa o'qiladi.
+        # Hech qaysi kursor berilmasa, eng oxirgi (yangi) sahifa qaytariladi.
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if after_id is not None:
+                    cursor.execute(
+                        "SELECT id, word FROM offensive_words WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+                    )
+                    rows = cursor.fetchall()
+                elif before_id is not None:
+                    cursor.execute(
+                        "SELECT id, word FROM offensive_words WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)
+                    )
+                    rows = cursor.fetchall()[::-1]
+                else:
+                    cursor.execute("SELECT id, word FROM offensive_words ORDER BY id DESC LIMIT ?", (limit,))
+                    rows = cursor.fetchall()[::-1]
+                if not rows:
+                    return [], False, False
+                cursor.execute("SELECT EXISTS(SELECT 1 FROM offensive_words WHERE id < ?)", (rows[0][0],))
+                has_prev = bool(cursor.fetchone()[0])
+                cursor.execute("SELECT EXISTS(SELECT 1 FROM offensive_words WHERE id > ?)", (rows[-1][0],))
+                has_next = bool(cursor.fetchone()[0])
+                return rows, has_prev, has_next
+        except sqlite3.Error as e:
+            logger.error(f"So'zlar sahifasini olishda xatolik: {e}")
+            return [], False, False
+
+    def search_words(self, prefix, limit):
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        # word ustunidagi UNIQUE indeks bo'yicha [prefix, prefix_keyingi) oralig'i
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT word FROM offensive_words WHERE word >= ? AND word < ? ORDER BY word LIMIT ?",
+                    (prefix, upper, limit)
+                )
+                return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"So'zlarni qidirishda xatolik: {e}")
+            return []
+
     def word_count(self):
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM offensive_words")
+                cursor.execute("SELECT value FROM meta WHERE key = 'word_count'")
                 return cursor.fetchone()[0]
         except sqlite3.Error as e:
             logger.error(f"So'zlar sonini olishda xatolik: {e}")
             return 0
 
+    def add_audit_records(self, rows):
+        # rows: [(created_at, chat_id, user_id, message_id, reason, matched), ...] - bitta tranzaksiyada
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    "INSERT INTO moderation_audit (created_at, chat_id, user_id, message_id, reason, matched) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                return len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Audit yozuvlarini saqlashda xatolik: {e}")
+            return -1
+
+    def audit_summary(self, column, value, since, top_column, limit=10):
+        # column: 'chat_id' yoki 'user_id' - ikkalasi ham (column, created_at) indeksi bilan o'qiladi
+        if column not in ('chat_id', 'user_id') or top_column not in ('chat_id', 'user_id'):
+            raise ValueError(column)
+        where = f"FROM moderation_audit WHERE {column} = ? AND created_at >= ?"
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT reason, COUNT(*) {where} GROUP BY reason ORDER BY 2 DESC", (value, since))
+                by_reason = cursor.fetchall()
+                cursor.execute(
+                    f"SELECT {top_column}, COUNT(*) {where} GROUP BY {top_column} ORDER BY 2 DESC LIMIT ?",
+                    (value, since, limit)
+                )
+                top = cursor.fetchall()
+                cursor.execute(
+                    f"SELECT matched, COUNT(*) {where} AND matched IS NOT NULL GROUP BY matched ORDER BY 2 DESC LIMIT ?",
+                    (value, since, limit)
+                )
+                matched = cursor.fetchall()
+                return by_reason, top, matched
+        except sqlite3.Error as e:
+            logger.error(f"Audit hisobotini olishda xatolik: {e}")
+            return [], [], []
+
+    CHAT_POLICY_FIELDS = ('allowed_links', 'blocked_extensions', 'block_stories', 'block_mentions')
+
+    def get_chat_policy(self, chat_id):
+        # (sozlamalar dict yoki None, [(so'z, mode), ...])
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT {', '.join(self.CHAT_POLICY_FIELDS)} FROM chat_policies WHERE chat_id = ?", (chat_id,)
+                )
+                row = cursor.fetchone()
+                settings = dict(zip(self.CHAT_POLICY_FIELDS, row)) if row else None
+                cursor.execute("SELECT word, mode FROM chat_words WHERE chat_id = ?", (chat_id,))
+                return settings, cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Chat ({chat_id}) sozlamalarini olishda xatolik: {e}")
+            return None, []
+
+    def set_chat_policy(self, chat_id, field, value):
+        if field not in self.CHAT_POLICY_FIELDS:
+            return False
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    f"INSERT INTO chat_policies (chat_id, {field}, updated_at) VALUES (?, ?, ?) "
+                    f"ON CONFLICT(chat_id) DO UPDATE SET {field} = excluded.{field}, updated_at = excluded.updated_at",
+                    (chat_id, value, datetime.now())
+                )
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Chat ({chat_id}) sozlamasini saqlashda xatolik: {e}")
+            return False
+
+    def set_chat_word(self, chat_id, word, mode):
+        try:
+            word = word.lower().strip()
+            if not word:
+                return "error"
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO chat_words (chat_id, word, mode, added_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(chat_id, word) DO UPDATE SET mode = excluded.mode WHERE mode != excluded.mode",
+                    (chat_id, word, mode, datetime.now())
+                )
+                return "added" if cursor.rowcount else "exists"
+        except sqlite3.Error as e:
+            logger.error(f"Chat ({chat_id}) so'zini saqlashda xatolik: {e}")
+            return "error"
+
+    def remove_chat_word(self, chat_id, word):
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM chat_words WHERE chat_id = ? AND word = ?", (chat_id, word.lower().strip()))
+                return "removed" if cursor.rowcount else "not_found"
+        except sqlite3.Error as e:
+            logger.error(f"Chat ({chat_id}) so'zini o'chirishda xatolik: {e}")
+            return "error"
+
+# --- ChatMemberCache sinfi ---
+class ChatMemberCache:
+    # (chat_id, user_id) -> status; TTL va LRU bilan cheklangan
+    def __init__(self, max_size=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._primed_chats = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            status, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return status
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, chat_id, user_id, status):
+        key = (chat_id, user_id)
+        self._entries[key] = (status, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id, user_id):
+        self._entries.pop((chat_id, user_id), None)
+
+    def invalidate_chat(self, chat_id):
+        self._primed_chats.pop(chat_id, None)
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            del self._entries[key]
+
+    def needs_priming(self, chat_id):
+        expires_at = self._primed_chats.get(chat_id)
+        return expires_at is None or expires_at <= time.monotonic()
+
+    def mark_primed(self, chat_id):
+        self._primed_chats[chat_id] = time.monotonic() + self.ttl
+        self._primed_chats.move_to_end(chat_id)
+        while len(self._primed_chats) > self.max_size:
+            self._primed_chats.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate}
+
+# --- LinkScanner sinfi ---
+class LinkScanner:
+    # Faqat havola/mention boshlanishini topamiz (lookahead butun qatorni qayta o'qimaydi),
+    # shuning uchun matn bir marta, chiziqli vaqtda ko'rib chiqiladi.
+    _candidate_pattern = re.compile(r'https?://(?=[a-zA-Z0-9./?=&-_%])|www\.(?=[a-zA-Z0-9./?=&-_%])|@(?=\w{5})', re.IGNORECASE)
+    _token_pattern = re.compile(r'\S+')
+    _url_pattern = re.compile(r'(?:[a-z][a-z0-9+.-]*://)?(?:[^/?#\s]*@)?([^/?#:]*)(?::\d*)?(.*)', re.DOTALL)
+
+    def __init__(self, allowed_links=ALLOWED_LINKS):
+        # host -> ruxsat etilgan yo'l prefikslari ("" - istalgan yo'l)
+        self.allowed = {}
+        for link in allowed_links:
+            host, slash, path = link.lower().partition('/')
+            host = self._normalize_host(host)
+            self.allowed.setdefault(host, set()).add(slash + path)
+
+    @staticmethod
+    def _normalize_host(host):
+        host = host.rstrip('.')
+        return host[4:] if host.startswith('www.') else host
+
+    def is_allowed_url(self, url):
+        match = self._url_pattern.match(url.lower())
+        host = self._normalize_host(match.group(1))
+        path = match.group(2)
+        while host:
+            prefixes = self.allowed.get(host)
+            if prefixes and any(path.startswith(prefix) for prefix in prefixes):
+                return True
+            host = host.partition('.')[2]
+        return False
+
+    def find_disallowed_entity(self, message):
+        if message.entities:
+            parsed = message.parse_entities([MessageEntity.URL, MessageEntity.TEXT_LINK])
+        elif message.caption_entities:
+            parsed = message.parse_caption_entities([MessageEntity.URL, MessageEntity.TEXT_LINK])
+        else:
+            return None
+        for entity, value in parsed.items():
+            url = entity.url if entity.type == MessageEntity.TEXT_LINK else value
+            if not self.is_allowed_url(url):
+                return url
+        return None
+
+    def scan(self, text):
+        mention_found = False
+        url_end = 0
+        for match in self._candidate_pattern.finditer(text):
+            start = match.start()
+            if text[start] == '@':
+                mention_found = True
+                continue
+            if start < url_end:
+                continue
+            token = self._token_pattern.match(text, start)
+            url_end = token.end()
+            if not self.is_allowed_url(token.group()):
+                return "link"
+        return "mention" if mention_found else None
+
+# --- ChatPolicy sinfi ---
+class ChatPolicy:
+    # Bitta chat qoidalari. Global automaton umumiy qoladi; chatda faqat qo'shimcha so'zlar
+    # uchun kichik "delta" automaton birinchi kerak bo'lganda quriladi.
+    def __init__(self, chat_id=None, revision=0, allowed_links=None, blocked_extensions=None,
+                 block_stories=True, block_mentions=True, extra_words=(), excluded_words=()):
+        self.chat_id = chat_id
+        self.revision = revision
+        self.allowed_links = allowed_links
+        self.link_scanner = LinkScanner(allowed_links) if allowed_links is not None else None
+        self.blocked_extensions = tuple(blocked_extensions) if blocked_extensions is not None else DEFAULT_BLOCKED_EXTENSIONS
+        self.block_stories = block_stories
+        self.block_mentions = block_mentions
+        self.extra_words = frozenset(extra_words)
+        self.excluded = frozenset(normalize_text(word) for word in excluded_words) - {''}
+        self._delta = None
+        self.is_default = chat_id is None
+        # Verdict keshi kaliti: standart qoidali chatlar natijalarni bo'lishadi
+        self.cache_salt = b'' if self.is_default else f"{chat_id}:{revision}".encode()
+
+    @classmethod
+    def from_db(cls, chat_id, revision, settings, words):
+        if settings is None and not words:
+            return DEFAULT_CHAT_POLICY
+        settings = settings or {}
+
+        def split(value):
+            return None if value is None else [item.strip().lower() for item in value.split(',') if item.strip()]
+
+        return cls(
+            chat_id, revision,
+            allowed_links=split(settings.get('allowed_links')),
+            blocked_extensions=split(settings.get('blocked_extensions')),
+            block_stories=settings.get('block_stories') is None or bool(settings['block_stories']),
+            block_mentions=settings.get('block_mentions') is None or bool(settings['block_mentions']),
+            extra_words=[word for word, mode in words if mode == 'add'],
+            excluded_words=[word for word, mode in words if mode == 'exclude'],
+        )
+
+    @property
+    def delta(self):
+        if self._delta is None:
+            automaton = ahocorasick.Automaton()
+            for word in {normalize_text(word) for word in self.extra_words} - {''}:
+                automaton.add_word(word, word)
+            if len(automaton):
+                automaton.make_automaton()
+            self._delta = automaton
+        return self._delta
+
+
+DEFAULT_CHAT_POLICY = ChatPolicy()
+
+
+class ChatPolicyCache:
+    # chat_id -> ChatPolicy, LRU. Chiqarib yuborilgan chat keyingi xabarda bazadan qayta yuklanadi.
+    def __init__(self, max_size=CHAT_POLICY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._revision = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def next_revision(self):
+        self._revision += 1
+        return self._revision
+
+    def get(self, chat_id):
+        policy = self._entries.get(chat_id)
+        if policy is not None:
+            self._entries.move_to_end(chat_id)
+        return policy
+
+    def set(self, chat_id, policy):
+        self._entries[chat_id] = policy
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def invalidate(self, chat_id):
+        self._entries.pop(chat_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def compiled_deltas(self):
+        return sum(1 for policy in self._entries.values() if policy._delta is not None)
+
+# --- TokenBucket sinfi ---
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self):
+        # Keyingi token uchun necha soniya kutish kerak (0 - hozir mavjud)
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+# --- ModerationActionQueue sinfi ---
+class ModerationActionQueue:
+    # Handlerlar faqat navbatga qo'shadi; fon vazifasi bir chatdagi o'chirishlarni
+    # deleteMessages (100 tagacha) so'rovlariga birlashtirib, global va har bir chat
+    # uchun token bucket bilan tezlikni cheklaydi va RetryAfter'da kutib qayta uradi.
+    def __init__(self, bot, global_rate=DELETE_GLOBAL_RATE, chat_rate=DELETE_CHAT_RATE,
+                 max_in_flight=DELETE_MAX_IN_FLIGHT, max_retries=DELETE_MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._pending = OrderedDict()
+        self._in_flight = set()
+        self._in_flight_limit = asyncio.Semaphore(max_in_flight)
+        self._wakeup = asyncio.Event()
+        self._worker_task = None
+        self.deleted = 0
+        self.api_calls = 0
+        self.retries = 0
+        self.errors = 0
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._pending.values())
+
+    def delete(self, chat_id, message_ids):
+        self._pending.setdefault(chat_id, set()).update(message_ids)
+        self._wakeup.set()
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self._worker())
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # To'lgan (bo'sh turgan) bucket'lar hech narsani cheklamaydi, ularni tashlab yuboramiz
+                for key in [key for key, b in self._chat_buckets.items() if b.delay() == 0 and b.tokens >= b.capacity]:
+                    del self._chat_buckets[key]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    def _take_ready_batch(self):
+        # Token'i bor birinchi chatni tanlaymiz; bo'lmasa eng kam kutish vaqtini qaytaramiz
+        wait = None
+        for chat_id in self._pending:
+            delay = self._chat_bucket(chat_id).delay()
+            if delay == 0:
+                break
+            wait = delay if wait is None else min(wait, delay)
+        else:
+            return None, None, wait
+        ids = self._pending[chat_id]
+        batch = sorted(ids)[:DELETE_BATCH_SIZE]
+        ids.difference_update(batch)
+        if ids:
+            self._pending.move_to_end(chat_id)
+        else:
+            del self._pending[chat_id]
+        return chat_id, batch, 0.0
+
+    async def _worker(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            global_delay = self._global_bucket.delay()
+            if global_delay:
+                await asyncio.sleep(global_delay)
+                continue
+            chat_id, batch, wait = self._take_ready_batch()
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._global_bucket.consume()
+            self._chat_bucket(chat_id).consume()
+            await self._in_flight_limit.acquire()
+            task = asyncio.create_task(self._execute(chat_id, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, chat_id, message_ids):
+        try:
+            for attempt in range(self.max_retries + 1):
+                method = 'deleteMessage' if len(message_ids) == 1 else 'deleteMessages'
+                started = time.perf_counter()
+                try:
+                    self.api_calls += 1
+                    if len(message_ids) == 1:
+                        await self.bot.delete_message(chat_id=chat_id, message_id=message_ids[0])
+                    else:
+                        await self.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+                    metrics.observe('moderator_api_seconds', time.perf_counter() - started, method=method)
+                    self.deleted += len(message_ids)
+                    metrics.inc('moderator_messages_deleted_total', len(message_ids))
+                    hot_logger.info("Chat (%s) dan %d ta xabar o'chirildi: %s", chat_id, len(message_ids), message_ids,
+                                    extra={'chat_id': chat_id, 'deleted': len(message_ids)})
+                    return
+                except RetryAfter as e:
+                    retry_after = e.retry_after
+                    delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                    self._chat_bucket(chat_id).pause(delay)
+                    metrics.inc('moderator_api_errors_total', method=method, error='RetryAfter')
+                    logger.warning(f"Chat ({chat_id}) uchun flood limit: {delay:.0f} s kutiladi.")
+                except BadRequest as e:
+                    # Xabar allaqachon o'chirilgan yoki botda huquq yo'q - qayta urinishdan foyda yo'q
+                    self.errors += 1
+                    metrics.inc('moderator_api_errors_total', method=method, error='BadRequest')
+                    logger.error(f"Chat ({chat_id}) xabarlarini {message_ids} o'chirishda xato: {e}")
+                    return
+                except NetworkError as e:
+                    metrics.inc('moderator_api_errors_total', method=method, error=type(e).__name__)
+                    delay = min(30.0, 0.5 * 2 ** attempt)
+                    logger.warning(f"Chat ({chat_id}) xabarlarini o'chirishda tarmoq xatosi: {e}. {delay:.1f} s dan keyin qayta urinish.")
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    metrics.inc('moderator_api_retries_total', method=method)
+                    self._in_flight_limit.release()
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        await self._in_flight_limit.acquire()
+            self.errors += 1
+            logger.error(f"Chat ({chat_id}) xabarlarini {message_ids} o'chirib bo'lmadi: urinishlar tugadi.")
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Chat ({chat_id}) xabarlarini {message_ids} o'chirishda kutilmagan xato: {e}", exc_info=True)
+        finally:
+            self._in_flight_limit.release()
+
+    async def close(self, timeout=10.0):
+        # Navbatdagi o'chirishlarni yakunlashga vaqt beramiz, keyin fon vazifasini to'xtatamiz
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._worker_task:
+            self._worker_task.cancel()
+        for task in list(self._in_flight):
+            task.cancel()
+
+# --- AuditLog sinfi ---
+class AuditLog:
+    # Write-behind bufer: check_message faqat ro'yxatga qo'shadi, bazaga yozish esa DB oqimida
+    # to'plab (taymer, AUDIT_FLUSH_SIZE yoki to'xtash paytida) bitta tranzaksiyada bajariladi.
+    def __init__(self, word_manager, flush_size=AUDIT_FLUSH_SIZE, max_buffer=AUDIT_MAX_BUFFER):
+        self.word_manager = word_manager
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._flush_task = None
+        self.written = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def record(self, chat_id, user_id, message_ids, reason, matched=None):
+        now = datetime.now()
+        rows = [(now, chat_id, user_id, message_id, reason, matched) for message_id in message_ids]
+        self._append(rows)
+        if len(self._buffer) >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _append(self, rows, front=False):
+        # Baza uzoq vaqt ishlamasa ham xotira cheklangan qoladi: ortiqcha yozuvlar tashlab yuboriladi
+        room = max(self.max_buffer - len(self._buffer), 0)
+        if len(rows) > room:
+            self.dropped += len(rows) - room
+            rows = rows[:room]
+        if front:
+            self._buffer[:0] = rows
+        else:
+            self._buffer.extend(rows)
+
+    async def flush(self):
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        written = await self.word_manager.run(self.word_manager.add_audit_records, rows)
+        if written < 0:
+            self._append(rows, front=True)
+            return 0
+        self.written += written
+        return written
+
+# --- MediaGroupAggregator sinfi ---
+class MediaGroupAggregator:
+    # (chat_id, media_group_id) -> albom holati. Yozuvlar oxirgi xabar vaqti bo'yicha
+    # tartiblangan, shuning uchun muddati o'tganlar boshidan arzon tozalanadi; umumiy
+    # hajm MEDIA_GROUP_MAX_ENTRIES bilan cheklangan (eng eskisi chiqarib yuboriladi).
+    def __init__(self, ttl=MEDIA_GROUP_TTL, max_entries=MEDIA_GROUP_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sweep(self):
+        now = time.monotonic()
+        removed = 0
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry['expires_at'] > now:
+                break
+            del self._entries[key]
+            removed += 1
+        return removed
+
+    def is_doomed(self, chat_id, media_group_id):
+        entry = self._entries.get((chat_id, media_group_id))
+        return entry is not None and entry['delete_required']
+
+    def add(self, chat_id, media_group_id, message_id, delete_required):
+        # O'chirilishi kerak bo'lgan xabar id'larini qaytaradi: albom birinchi marta
+        # o'chirishga belgilanganda - shu paytgacha ko'rilganlarning hammasi,
+        # keyin kelgan elementlar uchun - faqat shu xabar.
+        self.sweep()
+        key = (chat_id, media_group_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {'message_ids': set(), 'delete_required': False}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        entry['expires_at'] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        if entry['delete_required']:
+            return [message_id]
+        if len(entry['message_ids']) < MEDIA_GROUP_MAX_MESSAGES:
+            entry['message_ids'].add(message_id)
+        if delete_required:
+            entry['delete_required'] = True
+            return sorted(entry['message_ids'] | {message_id})
+        return []
+
+# --- FloodDetector sinfi ---
+# MinHash: matn 4 belgili bo'laklarga (shingle) ajratiladi, har bir bo'lak xeshi MINHASH_BINS ta
+# katakdan biriga tushadi va katakdagi eng kichik xesh saqlanadi (bitta permutatsiyali MinHash).
+# Har bir katakdan 1 bayt olinadi; ikki matnda bir xil chiqqan kataklar ulushi Jaccard o'xshashligiga yaqin.
+_SHINGLE_SIZE = 4
+_MINHASH_BINS = 16
+_MINHASH_MAX_CHARS = 1024
+
+
+def minhash(text):
+    normalized = ' '.join(_WORD_PATTERN.findall(normalize_text(text[:_MINHASH_MAX_CHARS])))
+    shingles = {normalized[i:i + _SHINGLE_SIZE] for i in range(len(normalized) - _SHINGLE_SIZE + 1)}
+    if not shingles:
+        return None
+    # Kamayish tartibida yoziladi, shuning uchun har bir katakda eng kichik xesh qoladi
+    minimums = {value % _MINHASH_BINS: value // _MINHASH_BINS for value in sorted(map(hash, shingles), reverse=True)}
+    values = [minimums.get(index) for index in range(_MINHASH_BINS)]
+    # Qisqa matnlarda bo'sh qolgan kataklar chapdagi to'ldirilgan katak qiymatini oladi
+    fill = next(value for value in reversed(values) if value is not None)
+    for index, value in enumerate(values):
+        if value is None:
+            values[index] = fill
+        else:
+            fill = value
+    return bytes(value & 0xFF for value in values)
+
+
+def minhash_similarity(a, b):
+    return sum(map(operator.eq, a, b)) / _MINHASH_BINS
+
+
+class FloodDetector:
+    # user_id -> oxirgi FLOOD_HISTORY ta xabar (vaqt, chat, msg id, albom, minhash).
+    # Tezlik (chat, user) bo'yicha sanaladi va bloklanadi, o'xshash nusxalar esa barcha chatlar bo'yicha.
+    # Kuzatiladigan foydalanuvchilar soni FLOOD_MAX_USERS bilan cheklangan (LRU).
+    def __init__(self, max_users=FLOOD_MAX_USERS):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self.evicted = 0
+        self.triggered = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    def observe(self, chat_id, user_id, message_id, text, media_group_id=None):
+        # Chegaradan oshilsa (sabab, {chat_id: [msg id, ...]}) qaytaradi, aks holda None.
+        now = time.monotonic()
+        state = self._users.get(user_id)
+        if state is None:
+            # blocked_until: chat_id -> muddat; None kaliti barcha chatlar uchun (takroriy xabarlar)
+            state = self._users[user_id] = {'history': deque(maxlen=FLOOD_HISTORY), 'blocked_until': {}}
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._users.move_to_end(user_id)
+
+        blocked_until = state['blocked_until']
+        if max(blocked_until.get(chat_id, 0.0), blocked_until.get(None, 0.0)) > now:
+            return "flood", {chat_id: [message_id]}
+
+        fingerprint = minhash(text) if len(text) >= DUPLICATE_MIN_LENGTH else None
+        history = state['history']
+        history.append((now, chat_id, message_id, media_group_id, fingerprint))
+
+        # Tarix vaqt bo'yicha tartiblangan: oxiridan boshlab, oyna tugaguncha o'qiladi.
+        # Albom elementlari bitta xabar sifatida sanaladi.
+        rate_since = now - FLOOD_WINDOW
+        duplicate_since = now - DUPLICATE_WINDOW
+        recent = set()
+        copies = 0
+        for ts, chat, msg_id, group, other in reversed(history):
+            if ts < rate_since and (fingerprint is None or ts < duplicate_since):
+                break
+            if ts >= rate_since and chat == chat_id:
+                recent.add(group or msg_id)
+            if fingerprint is not None and other is not None and ts >= duplicate_since \
+                    and minhash_similarity(fingerprint, other) >= DUPLICATE_MIN_SIMILARITY:
+                copies += 1
+
+        if len(recent) > FLOOD_MAX_MESSAGES:
+            return self._trigger(state, now, "flood", rate_since, chat_id)
+        if copies >= DUPLICATE_MAX_COPIES:
+            return self._trigger(state, now, "takroriy xabar", duplicate_since)
+        return None
+
+    def _trigger(self, state, now, reason, since, chat_id=None):
+        # chat_id berilsa blok va o'chirish faqat shu chatga tegishli, aks holda barcha chatlarga
+        self.triggered += 1
+        blocked_until = state['blocked_until']
+        for key in [key for key, until in blocked_until.items() if until <= now]:
+            del blocked_until[key]
+        blocked_until[chat_id] = now + FLOOD_BLOCK_SECONDS
+        to_delete = {}
+        kept = []
+        for entry in state['history']:
+            ts, chat, msg_id, _, _ = entry
+            if chat_id is not None and chat != chat_id:
+                kept.append(entry)
+            elif ts >= since:
+                to_delete.setdefault(chat, []).append(msg_id)
+        state['history'].clear()
+        state['history'].extend(kept)
+        return reason, to_delete
+
+# --- VerdictCache sinfi ---
+class VerdictCache:
+    # Matn + entity'lar xeshi -> tekshiruv natijasi. Har bir yozuv automaton versiyasi bilan
+    # belgilanadi: so'zlar ro'yxati o'zgarsa eski yozuvlar o'z-o'zidan eskiradi.
+    MISS = object()
+
+    def __init__(self, max_size=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(text, message, salt=b''):
+        # salt - chat qoidalari (standart qoidali chatlar uchun bo'sh)
+        digest = hashlib.blake2b(salt + b'\0', digest_size=16)
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        for entity in message.entities or message.caption_entities or ():
+            if entity.type in (MessageEntity.URL, MessageEntity.TEXT_LINK):
+                digest.update(f"\0{entity.type}:{entity.offset}:{entity.length}:{entity.url or ''}".encode())
+        return digest.digest()
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is not None:
+            verdict, entry_version, expires_at = entry
+            if entry_version == version and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return verdict
+            del self._entries[key]
+        self.misses += 1
+        return self.MISS
+
+    def set(self, key, version, verdict):
+        self._entries[key] = (verdict, version, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate}
+
+# --- ChatOrderedUpdateProcessor sinfi ---
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    # Turli chatlarning update'lari parallel, bitta chatniki esa kelgan tartibida qayta ishlanadi
+    # (media guruh va tahrir/o'chirish tartibi buzilmasligi uchun). Chat navbatini kutayotgan
+    # update'lar umumiy semaphore o'rnini egallamaydi, shuning uchun bitta "shovqinli" chat
+    # boshqalarni to'sib qo'ymaydi.
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}
+
+    async def process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
 # --- Owner ID tekshiruvchi dekorator ---
 def owner_only(func):
     @functools.wraps(func)
@@ -132,73 +1628,429 @@ def owner_only(func):
         return await func(self, update, context, *args, **kwargs)
     return wrapped
 
+def strict_owner_only(func):
+    # Guruhlarda ham faqat bot egasi: ommaviy yozish va boshqa chatlar ma'lumotini ko'rsatadigan buyruqlar uchun
+    @functools.wraps(func)
+    async def wrapped(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user_id = update.effective_user.id
+        if user_id != OWNER_ID:
+            logger.warning(f"Ruxsatsiz foydalanuvchi (ID: {user_id}) chat ({update.effective_chat.id}) da {func.__name__} buyrug'ini ishlatmoqda.")
+            await update.message.reply_text("Kechirasiz, bu buyruq faqat bot egasi uchun mo‘ljallangan.")
+            return
+        return await func(self, update, context, *args, **kwargs)
+    return wrapped
+
+def chat_admin_only(func):
+    # Chat qoidalarini faqat shu guruh adminlari (anonim adminlar ham) yoki bot egasi o'zgartiradi
+    @functools.wraps(func)
+    async def wrapped(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user_id = update.effective_user.id
+        chat = update.effective_chat
+        if chat.type == Chat.PRIVATE:
+            await update.message.reply_text("Bu buyruq guruh ichida ishlatiladi.")
+            return
+        sender_chat = update.message.sender_chat
+        if user_id != OWNER_ID and not (sender_chat and sender_chat.id == chat.id):
+            status = await self._get_member_status(context.bot, chat.id, user_id)
+            if status not in ('administrator', 'creator'):
+                logger.warning(f"Ruxsatsiz foydalanuvchi (ID: {user_id}) chat ({chat.id}) da {func.__name__} buyrug'ini ishlatmoqda.")
+                await update.message.reply_text("Kechirasiz, bu buyruq faqat guruh adminlari uchun mo‘ljallangan.")
+                return
+        return await func(self, update, context, *args, **kwargs)
+    return wrapped
+
 # --- TelegramModerator sinfi ---
 class TelegramModerator:
-    def __init__(self, token, application: Application):
-        self.word_manager = OffensiveWordManager()
+    def __init__(self, token, application: Application, word_manager=None):
+        self.word_manager = word_manager or OffensiveWordManager()
         self.token = token
         self.application = application
         self.words_per_page = 50
         self.A = ahocorasick.Automaton()
-        self._rebuild_automaton()
-        self.link_pattern = re.compile(
-            r'http[s]?://(?!.*(?:youtube\.com/watch|youtu\.be/|youtube\.com/shorts|m\.youtube\.com))[a-zA-Z0-9./?=&-_%]+' +
-            r'|' +
-            r'www\.(?!.*(?:youtube\.com/watch|youtu\.be/|youtube\.com/shorts|m\.youtube\.com))[a-zA-Z0-9./?=&-_%]+',
-            re.IGNORECASE
+        self.fuzzy_index = None
+        self.automaton_version = 0
+        self._words = None
+        self._change_id = 0
+        self._policy_change_id = 0
+        self._data_version = None
+        self._sync_lock = asyncio.Lock()
+        self._automaton_dirty = False
+        self._rebuild_task = None
+        self._load_automaton()
+        self.link_scanner = LinkScanner()
+        self.media_groups = MediaGroupAggregator()
+        self.verdict_cache = VerdictCache()
+        self.flood = FloodDetector()
+        self.chat_policies = ChatPolicyCache()
+        self.audit = AuditLog(self.word_manager)
+        self._register_metrics()
+        self.member_cache = ChatMemberCache()
+        self.actions = ModerationActionQueue(application.bot)
+
+    @staticmethod
+    def _build_automaton(words):
+        automaton = ahocorasick.Automaton()
+        canonical_words = {normalize_text(word.strip()) for word in words if word}
+        canonical_words.discard('')
+        for word in canonical_words:
+            automaton.add_word(word, word)
+        if canonical_words:
+            automaton.make_automaton()
+            logger.info(f"Automaton {len(words)} so‘z ({len(canonical_words)} kanonik shakl) bilan qurildi.")
+        else:
+            logger.info("Haqoratli so‘zlar ro‘yxati bo‘sh, automaton qurilmadi.")
+        return automaton
+
+    @staticmethod
+    def _build_fuzzy_index(automaton):
+        # Taxminiy moslik indeksi automaton'dagi kanonik so'zlardan quriladi (FUZZY_MATCH=1 bo'lsa)
+        if not FUZZY_MATCH:
+            return None
+        started = time.perf_counter()
+        fuzzy_index = FuzzyIndex(automaton.keys() if len(automaton) else (), FUZZY_MAX_DISTANCE, FUZZY_MIN_LENGTH)
+        logger.info(
+            f"Fuzzy indeks qurildi: {fuzzy_index.words} so'z, {len(fuzzy_index)} kalit, "
+            f"{(time.perf_counter() - started) * 1000:.1f} ms"
         )
-        self.mention_pattern = re.compile(r'@[\w]{5,}')
-        self.media_group_cache = {}
+        return fuzzy_index
+
+    def _swap_automaton(self, automaton, fuzzy_index=None):
+        # Atributlar await'siz almashtiriladi: check_message yangi automaton tayyor bo'lguncha eskisidan foydalanadi
+        self.A = automaton
+        self.fuzzy_index = fuzzy_index
+        self.automaton_version += 1
+
+    @staticmethod
+    def _snapshot_key(version, words):
+        # words_version hisoblagichi bazalar orasida noyob emas (tiklangan yoki almashtirilgan bot_data.db),
+        # shuning uchun kalitga so'zlar ro'yxatining xeshi ham kiradi
+        digest = hashlib.blake2b('\n'.join(sorted(words)).encode(), digest_size=8).hexdigest()
+        return (version, NORMALIZER_VERSION, digest)
+
+    def _load_snapshot(self, version, words):
+        if version is None or not os.path.exists(AUTOMATON_SNAPSHOT):
+            return None
+        try:
+            with open(AUTOMATON_SNAPSHOT, 'rb') as f:
+                key, automaton = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Automaton snapshot'ini o'qishda xatolik: {e}")
+            return None
+        expected = self._snapshot_key(version, words)
+        if key != expected:
+            logger.info(f"Automaton snapshot'i eskirgan (snapshot: {key}, baza: {expected}).")
+            return None
+        return automaton
+
+    def _save_snapshot(self, version, words, automaton):
+        if version is None:
+            return
+        # Bir papkadagi bir nechta jarayon bir-birining vaqtinchalik faylini buzmasligi uchun nom noyob
+        directory = os.path.dirname(os.path.abspath(AUTOMATON_SNAPSHOT))
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(AUTOMATON_SNAPSHOT)}.", suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((self._snapshot_key(version, words), automaton), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, AUTOMATON_SNAPSHOT)
+        except Exception as e:
+            logger.warning(f"Automaton snapshot'ini saqlashda xatolik: {e}")
+            if tmp_path:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+    def _load_automaton(self):
+        started = time.perf_counter()
+        # data_version so'zlardan oldin o'qiladi: oradagi boshqa jarayon o'zgarishlari keyingi so'rovda ko'rinadi
+        self._data_version = self.word_manager.data_version()
+        self._policy_change_id = self.word_manager.chat_policy_change_id()
+        words, version, change_id = self.word_manager.get_words_with_state()
+        automaton = self._load_snapshot(version, words)
+        if automaton is not None:
+            self._swap_automaton(automaton, self._build_fuzzy_index(automaton))
+            self._words = set(words)
+            self._change_id = change_id
+            source = "snapshot"
+        else:
+            version = self._rebuild_automaton()
+            self._save_snapshot(version, self._words, self.A)
+            source = "qayta qurish"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Automaton tayyor ({source}, {len(self.A)} kanonik so'z): {elapsed_ms:.1f} ms")
 
     def _rebuild_automaton(self):
         logger.info("Aho-Corasick automaton'ni qayta qurish...")
-        self.A = ahocorasick.Automaton()
-        offensive_words = self.word_manager.get_words()
-        for word in offensive_words:
-            if word:
-                self.A.add_word(word.strip(), word.strip())
-        if offensive_words:
-            self.A.make_automaton()
-            logger.info(f"Automaton {len(offensive_words)} so‘z bilan qurildi.")
-        else:
-            logger.info("Haqoratli so‘zlar ro‘yxati bo‘sh, automaton qurilmadi.")
+        words, version, self._change_id = self.word_manager.get_words_with_state()
+        self._words = set(words)
+        automaton = self._build_automaton(self._words)
+        self._swap_automaton(automaton, self._build_fuzzy_index(automaton))
+        return version
+
+    async def _sync_words(self):
+        # word_changes jurnalidagi yangi yozuvlar (o'zimizniki ham, boshqa jarayonlarniki ham)
+        # commit tartibida qo'llanadi. Qaytariladigan versiya self._words holatiga aynan mos keladi.
+        async with self._sync_lock:
+            changed = False
+            while True:
+                version, min_id, rows = await self.word_manager.run(
+                    self.word_manager.word_changes_since, self._change_id, WORD_SYNC_BATCH
+                )
+                if version is None:
+                    # O'qish xatosi: oldingi partiyalarda qo'llangan o'zgarishlar ham automaton'ga yetib borishi kerak
+                    if changed:
+                        self._schedule_rebuild()
+                    return None
+                if min_id is not None and self._change_id < min_id - 1:
+                    # Kerakli yozuvlar jurnaldan tozalangan - ro'yxat to'liq qayta yuklanadi
+                    logger.warning(f"So'zlar jurnali {self._change_id}-yozuvdan keyin tozalangan, to'liq qayta yuklash.")
+                    words, version, self._change_id = await self.word_manager.run(self.word_manager.get_words_with_state)
+                    self._words = set(words)
+                    changed = True
+                    break
+                for _, word, op in rows:
+                    if op == 'add' and word not in self._words:
+                        self._words.add(word)
+                        changed = True
+                    elif op == 'remove' and word in self._words:
+                        self._words.discard(word)
+                        changed = True
+                if rows:
+                    self._change_id = rows[-1][0]
+                if len(rows) < WORD_SYNC_BATCH:
+                    break
+            if changed:
+                logger.info(f"So'zlar ro'yxati yangilandi (jurnal: {self._change_id}, versiya: {version}).")
+                self._schedule_rebuild()
+            return version
+
+    async def _apply_word_edit(self):
+        await self._sync_words()
+        await self.word_manager.run(self.word_manager.prune_word_changes, WORD_CHANGES_KEEP)
 
-    def _contains_offensive_words(self, text):
-        if not text or not self.A.kind == ahocorasick.AHOCORASICK:
+    async def poll_word_changes(self, context: ContextTypes.DEFAULT_TYPE):
+        # Boshqa jarayonlar bazani o'zgartirmagan bo'lsa, faqat bitta PRAGMA bajariladi
+        data_version = await self.word_manager.run(self.word_manager.data_version)
+        if data_version == self._data_version:
+            return
+        # Versiya faqat muvaffaqiyatli sinxronlashdan keyin yoziladi: o'qish xatosi keyingi so'rovda qayta urinadi
+        words_synced = await self._sync_words() is not None
+        policies_synced = await self._sync_chat_policies()
+        if words_synced and policies_synced:
+            self._data_version = data_version
+
+    async def _sync_chat_policies(self):
+        # Boshqa jarayonlar /chatword yoki /setpolicy bilan o'zgartirgan chatlar keshdan chiqariladi
+        min_id, max_id, chat_ids = await self.word_manager.run(
+            self.word_manager.chat_policy_changes_since, self._policy_change_id
+        )
+        if chat_ids is None:
             return False
-        text = text.lower()
-        for end_index, found_word in self.A.iter(text):
+        if min_id is not None and self._policy_change_id < min_id - 1:
+            logger.warning(f"Chat qoidalari jurnali {self._policy_change_id}-yozuvdan keyin tozalangan, kesh tozalanadi.")
+            self.chat_policies.clear()
+        else:
+            for chat_id in chat_ids:
+                self.chat_policies.invalidate(chat_id)
+        if max_id is not None:
+            self._policy_change_id = max_id
+        return True
+
+    def _build_and_save(self, version, words):
+        automaton = self._build_automaton(words)
+        self._save_snapshot(version, words, automaton)
+        return automaton, self._build_fuzzy_index(automaton)
+
+    def _schedule_rebuild(self):
+        # Ketma-ket tahrirlar bitta qayta qurishga birlashtiriladi
+        self._automaton_dirty = True
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild_worker())
+
+    async def _rebuild_worker(self):
+        loop = asyncio.get_running_loop()
+        while self._automaton_dirty:
+            await asyncio.sleep(REBUILD_DEBOUNCE)
+            try:
+                # Jurnal va versiya bitta tranzaksiyada o'qiladi, so'zlar nusxasi await'siz olinadi:
+                # snapshot aynan o'zidagi so'zlarga mos versiya bilan belgilanadi
+                version = await self._sync_words()
+                self._automaton_dirty = False
+                words = list(self._words)
+                automaton, fuzzy_index = await loop.run_in_executor(None, self._build_and_save, version, words)
+            except Exception as e:
+                self._automaton_dirty = False
+                logger.error(f"Automaton'ni fonda qayta qurishda xatolik: {e}", exc_info=True)
+                continue
+            self._swap_automaton(automaton, fuzzy_index)
+
+    def _contains_offensive_words(self, text, policy=DEFAULT_CHAT_POLICY):
+        automaton, fuzzy_index = self.A, self.fuzzy_index
+        if not text:
+            return None
+        normalized = normalize_text(text)
+        # Global automaton (chatda chiqarilgan so'zlarsiz) + chatning qo'shimcha so'zlari
+        # Topilgan kanonik so'z qaytariladi (audit uchun)
+        if automaton.kind == ahocorasick.AHOCORASICK:
+            found_word = self._find_word(automaton, normalized, text, policy.excluded)
+            if found_word:
+                return found_word
+        if policy.extra_words:
+            delta = policy.delta
+            if delta.kind == ahocorasick.AHOCORASICK:
+                found_word = self._find_word(delta, normalized, text, ())
+                if found_word:
+                    return found_word
+        # Aniq moslik yo'q: bitta-ikki harfi o'zgartirilgan so'zlarni indeks orqali qidiramiz
+        if fuzzy_index is not None:
+            match = fuzzy_index.find(normalized, policy.excluded)
+            if match:
+                token, found_word = match
+                hot_logger.info("Haqoratli so‘zga o'xshash so'z topildi: '%s' ~ '%s' matnda: '%s...'", token, found_word, text[:50],
+                                extra={'matched': found_word, 'fuzzy': True})
+                return found_word
+        return None
+
+    @staticmethod
+    def _find_word(automaton, normalized, text, excluded):
+        for end_index, found_word in automaton.iter(normalized):
+            if found_word in excluded:
+                continue
             start_index = end_index - len(found_word) + 1
-            is_start_boundary = start_index == 0 or not text[start_index - 1].isalnum()
-            is_end_boundary = end_index == len(text) - 1 or not text[end_index + 1].isalnum()
+            is_start_boundary = start_index == 0 or not normalized[start_index - 1].isalnum()
+            is_end_boundary = end_index == len(normalized) - 1 or not normalized[end_index + 1].isalnum()
             if is_start_boundary and is_end_boundary:
-                logger.info(f"Haqoratli so‘z topildi: '{found_word}' matnda: '{text[:50]}...'")
-                return True
-        return False
+                # Asl matndagi bo'lak faqat log uchun: topilmasa ham qaror o'zgarmaydi
+                _, offsets = normalize_with_offsets(text)
+                if end_index < len(offsets):
+                    original = text[offsets[start_index]:offsets[end_index] + 1]
+                else:
+                    original = found_word
+                hot_logger.info("Haqoratli so‘z topildi: '%s' ('%s') matnda: '%s...'", found_word, original, text[:50],
+                                extra={'matched': found_word})
+                return found_word
+        return None
 
-    def _contains_disallowed_content(self, text, message):
+    def _contains_disallowed_content(self, text, message, policy=DEFAULT_CHAT_POLICY):
         if not text:
             return None
-        text_lower = text.lower()
-        if self.link_pattern.search(text_lower):
-            logger.info(f"Ruxsatsiz havola topildi: {text[:50]}...")
+        link_scanner = policy.link_scanner or self.link_scanner
+        # Telegram entity'lari ishonchli: ruxsatsiz havola topilsa, matnni skanerlash shart emas
+        url = link_scanner.find_disallowed_entity(message)
+        if url:
+            hot_logger.info("Entity orqali ruxsatsiz havola topildi: %s", url)
             return "link"
-        if self.mention_pattern.search(text_lower):
-            logger.info(f"Mention topildi: {text[:50]}...")
-            return "mention"
-        entities = message.entities or message.caption_entities or []
-        allowed_domains = ['youtube.com/watch', 'youtu.be/', 'youtube.com/shorts', 'm.youtube.com']
-        for entity in entities:
-            if entity.type == 'url':
-                url = text[entity.offset: entity.offset + entity.length].lower()
-                if not any(domain in url for domain in allowed_domains):
-                    logger.info(f"Entity orqali ruxsatsiz URL topildi: {url}")
-                    return "link"
-            elif entity.type == 'text_link':
-                url = entity.url.lower()
-                if not any(domain in url for domain in allowed_domains):
-                    logger.info(f"Entity orqali ruxsatsiz text_link topildi: {url}")
-                    return "link"
+        disallowed_type = link_scanner.scan(text)
+        if disallowed_type == "link":
+            hot_logger.info("Ruxsatsiz havola topildi: %s...", text[:50])
+        elif disallowed_type == "mention":
+            if not policy.block_mentions:
+                return None
+            hot_logger.info("Mention topildi: %s...", text[:50])
+        return disallowed_type
+
+    async def _get_chat_policy(self, chat_id):
+        policy = self.chat_policies.get(chat_id)
+        if policy is None:
+            # DB so'rovlari bitta oqimda navbat bilan bajariladi, shuning uchun tahrirdan oldin
+            # boshlangan yuklash keshga tahrirdan keyingi invalidate'dan oldin yoziladi
+            revision = self.chat_policies.next_revision()
+            settings, words = await self.word_manager.run(self.word_manager.get_chat_policy, chat_id)
+            policy = ChatPolicy.from_db(chat_id, revision, settings, words)
+            self.chat_policies.set(chat_id, policy)
+        return policy
+
+    def _register_metrics(self):
+        metrics.register('moderator_automaton_words', 'gauge', lambda: len(self.A))
+        metrics.register('moderator_automaton_version', 'gauge', lambda: self.automaton_version)
+        metrics.register('moderator_word_change_id', 'gauge', lambda: self._change_id)
+        metrics.register('moderator_fuzzy_index_keys', 'gauge', lambda: len(self.fuzzy_index) if self.fuzzy_index else 0)
+        metrics.register('moderator_media_groups', 'gauge', lambda: len(self.media_groups))
+        metrics.register('moderator_media_groups_evicted_total', 'counter', lambda: self.media_groups.evicted)
+        metrics.register('moderator_member_cache_size', 'gauge', lambda: len(self.member_cache))
+        metrics.register('moderator_member_cache_hits_total', 'counter', lambda: self.member_cache.hits)
+        metrics.register('moderator_member_cache_misses_total', 'counter', lambda: self.member_cache.misses)
+        metrics.register('moderator_delete_queue_pending', 'gauge', lambda: len(self.actions))
+        metrics.register('moderator_verdict_cache_size', 'gauge', lambda: len(self.verdict_cache))
+        metrics.register('moderator_flood_tracked_users', 'gauge', lambda: len(self.flood))
+        metrics.register('moderator_flood_triggers_total', 'counter', lambda: self.flood.triggered)
+        metrics.register('moderator_chat_policies_cached', 'gauge', lambda: len(self.chat_policies))
+        metrics.register('moderator_audit_buffer', 'gauge', lambda: len(self.audit))
+        metrics.register('moderator_audit_written_total', 'counter', lambda: self.audit.written)
+        metrics.register('moderator_audit_dropped_total', 'counter', lambda: self.audit.dropped)
+        metrics.register('moderator_chat_policies_evicted_total', 'counter', lambda: self.chat_policies.evicted)
+        metrics.register('moderator_verdict_cache_hits_total', 'counter', lambda: self.verdict_cache.hits)
+        metrics.register('moderator_verdict_cache_misses_total', 'counter', lambda: self.verdict_cache.misses)
+
+    def _delete(self, chat_id, message_ids, reason, user_id=None, matched=None):
+        metrics.inc('moderator_deletions_total', reason=reason)
+        metrics.inc('moderator_deletions_by_chat_total', chat_id=metrics.chat_label(chat_id))
+        self.audit.record(chat_id, user_id, message_ids, reason, matched)
+        self.actions.delete(chat_id, message_ids)
+
+    async def flush_audit(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.audit.flush()
+
+    async def _prime_chat_admins(self, bot, chat_id):
+        # Bir vaqtda kelgan xabarlar qayta-qayta so'rov yubormasligi uchun oldindan belgilaymiz
+        self.member_cache.mark_primed(chat_id)
+        started = time.perf_counter()
+        try:
+            admins = await bot.get_chat_administrators(chat_id)
+            metrics.observe('moderator_api_seconds', time.perf_counter() - started, method='getChatAdministrators')
+        except Exception as e:
+            metrics.inc('moderator_api_errors_total', method='getChatAdministrators', error=type(e).__name__)
+            logger.warning(f"Chat ({chat_id}) adminlarini olishda xatolik: {e}")
+            return
+        for admin in admins:
+            self.member_cache.set(chat_id, admin.user.id, admin.status)
+        logger.info("Chat (%s) uchun %d ta admin keshga yuklandi.", chat_id, len(admins))
+
+    async def _get_member_status(self, bot, chat_id, user_id):
+        if self.member_cache.needs_priming(chat_id):
+            await self._prime_chat_admins(bot, chat_id)
+        status = self.member_cache.get(chat_id, user_id)
+        if status is None:
+            started = time.perf_counter()
+            try:
+                member = await bot.get_chat_member(chat_id, user_id)
+            except Exception as e:
+                metrics.inc('moderator_api_errors_total', method='getChatMember', error=type(e).__name__)
+                raise
+            metrics.observe('moderator_api_seconds', time.perf_counter() - started, method='getChatMember')
+            status = member.status
+            self.member_cache.set(chat_id, user_id, status)
+        return status
+
+    async def track_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        member_update = update.chat_member or update.my_chat_member
+        if not member_update:
+            return
+        chat_id = member_update.chat.id
+        new_member = member_update.new_chat_member
+        if update.my_chat_member:
+            # Botning o'z huquqlari o'zgardi: chat keshini tozalab, adminlarni qayta yuklaymiz
+            self.member_cache.invalidate_chat(chat_id)
+            logger.info(f"Botning chat ({chat_id}) dagi statusi o'zgardi: {new_member.status}")
+            return
+        self.member_cache.set(chat_id, new_member.user.id, new_member.status)
+
+    def _classify_text(self, text, message, policy=DEFAULT_CHAT_POLICY):
+        # (sabab, topilgan so'z) yoki None
+        # Haqoratli so‘zlarni tekshirish
+        stage_started = time.perf_counter()
+        found_word = self._contains_offensive_words(text, policy)
+        metrics.observe('moderator_stage_seconds', time.perf_counter() - stage_started, stage='offensive_scan')
+        if found_word:
+            return "haqoratli so'z", found_word
+
+        # Ruxsatsiz kontentni tekshirish
+        stage_started = time.perf_counter()
+        disallowed_type = self._contains_disallowed_content(text, message, policy)
+        metrics.observe('moderator_stage_seconds', time.perf_counter() - stage_started, stage='link_scan')
+        if disallowed_type == "link":
+            return "ruxsatsiz havola", None
+        if disallowed_type == "mention":
+            return "mention (@username)", None
         return None
 
     async def check_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -209,124 +2061,96 @@ class TelegramModerator:
         user_id = update.message.from_user.id
         message_id = update.message.message_id
         media_group_id = update.message.media_group_id
+        started = time.perf_counter()
+        metrics.inc('moderator_messages_checked_total')
 
         try:
+            policy = DEFAULT_CHAT_POLICY
             # Guruhlarda admin va creatorlarni tekshirish
             if update.message.chat.type != Chat.PRIVATE:
-                member = await context.bot.get_chat_member(chat_id, user_id)
-                if member.status in ['administrator', 'creator','left']:
-                    logger.info(f"Foydalanuvchi admin yoki creator (ID: {user_id}), tekshiruv o'tkazib yuborildi.")
+                stage_started = time.perf_counter()
+                status = await self._get_member_status(context.bot, chat_id, user_id)
+                metrics.observe('moderator_stage_seconds', time.perf_counter() - stage_started, stage='member_status')
+                if status in ['administrator', 'creator','left']:
+                    hot_logger.debug("Foydalanuvchi admin yoki creator (ID: %s), tekshiruv o'tkazib yuborildi.", user_id)
                     return
+                policy = await self._get_chat_policy(chat_id)
+
+            # O'chirishga belgilangan albomning keyingi elementlari darhol o'chiriladi
+            if media_group_id and self.media_groups.is_doomed(chat_id, media_group_id):
+                self._delete(chat_id, self.media_groups.add(chat_id, media_group_id, message_id, delete_required=True), "media guruh", user_id)
+                return
 
             # Story’larni tekshirish
-            if update.message.story:
-                logger.info(f"Story aniqlandi: Chat ID: {chat_id}, User ID: {user_id}, Story ID: {update.message.story.id}")
-                delete_reason = "story"
-                try:
-                    await update.message.delete()
-                    logger.info(f"Story (ID: {update.message.story.id}) muvaffaqiyatli o'chirildi.")
-                except Exception as e:
-                    logger.error(f"Story’ni o'chirishda xatolik (ID: {update.message.story.id}): {e}")
+            if update.message.story and policy.block_stories:
+                hot_logger.info("Story aniqlandi: Chat ID: %s, User ID: %s, Story ID: %s", chat_id, user_id, update.message.story.id)
+                self._delete(chat_id, [message_id], "story", user_id)
                 return
 
             # Matn va caption’ni olish
             text_content = update.message.text or update.message.caption or ""
             delete_reason = None
+            matched = None
 
-            # Haqoratli so‘zlarni tekshirish
-            if self._contains_offensive_words(text_content):
-                delete_reason = "haqoratli so'z"
+            # Flood va bir xil xabarlarni ko'p marta yuborishni tekshirish
+            if update.message.chat.type != Chat.PRIVATE:
+                stage_started = time.perf_counter()
+                flood = self.flood.observe(chat_id, user_id, message_id, text_content, media_group_id)
+                metrics.observe('moderator_stage_seconds', time.perf_counter() - stage_started, stage='flood')
+                if flood:
+                    flood_reason, to_delete = flood
+                    hot_logger.info(
+                        "Flood aniqlandi (%s). User ID: %s, xabarlar: %s", flood_reason, user_id, to_delete,
+                        extra={'reason': flood_reason, 'chat_id': chat_id, 'user_id': user_id}
+                    )
+                    if media_group_id:
+                        self.media_groups.add(chat_id, media_group_id, message_id, delete_required=True)
+                    for flood_chat_id, message_ids in to_delete.items():
+                        self._delete(flood_chat_id, message_ids, flood_reason, user_id)
+                    return
 
-            # Ruxsatsiz kontentni tekshirish
-            if not delete_reason:
-                disallowed_type = self._contains_disallowed_content(text_content, update.message)
-                if disallowed_type == "link":
-                    delete_reason = "ruxsatsiz havola"
-                elif disallowed_type == "mention":
-                    delete_reason = "mention (@username)"
+            # Matnni tekshirish (takrorlangan spam matnlari keshdan olinadi)
+            if text_content:
+                cache_key = VerdictCache.make_key(text_content, update.message, policy.cache_salt)
+                verdict = self.verdict_cache.get(cache_key, self.automaton_version)
+                if verdict is VerdictCache.MISS:
+                    verdict = self._classify_text(text_content, update.message, policy)
+                    self.verdict_cache.set(cache_key, self.automaton_version, verdict)
+                if verdict:
+                    delete_reason, matched = verdict
 
-            # APK fayllarni tekshirish
-            if not delete_reason and update.message.document:
+            # Taqiqlangan fayllarni (standart - APK) tekshirish
+            if not delete_reason and update.message.document and policy.blocked_extensions:
                 file_name = update.message.document.file_name or ""
-                if file_name.lower().endswith('.apk'):
-                    delete_reason = "APK fayl"
-                    logger.info(f"APK fayl aniqlandi: {file_name}")
+                if file_name.lower().endswith(policy.blocked_extensions):
+                    delete_reason = "APK fayl" if file_name.lower().endswith('.apk') else "taqiqlangan fayl"
+                    matched = file_name
+                    hot_logger.info("Taqiqlangan fayl aniqlandi: %s", file_name)
 
             # Agar o‘chirish uchun sabab topilsa
             if delete_reason:
-                logger.info(f"Xabarni o'chirish sababi: '{delete_reason}'. User ID: {user_id}, Chat ID: {chat_id}, Msg ID: {message_id}")
+                hot_logger.info(
+                    "Xabarni o'chirish sababi: '%s'. User ID: %s, Chat ID: %s, Msg ID: %s",
+                    delete_reason, user_id, chat_id, message_id,
+                    extra={'reason': delete_reason, 'chat_id': chat_id, 'user_id': user_id, 'message_id': message_id}
+                )
                 if media_group_id:
-                    await self.schedule_media_group_check(context, chat_id, media_group_id, message_id, delete_required=True)
+                    message_ids = self.media_groups.add(chat_id, media_group_id, message_id, delete_required=True)
+                    hot_logger.info("Media guruh (%s) o‘chirilmoqda. Xabarlar: %s", media_group_id, message_ids)
+                    self._delete(chat_id, message_ids, delete_reason, user_id, matched)
                 else:
-                    try:
-                        await update.message.delete()
-                        logger.info(f"Xabar (ID: {message_id}) muvaffaqiyatli o'chirildi ({delete_reason}).")
-                    except Exception as e:
-                        logger.error(f"Xabarni (ID: {message_id}) o'chirishda xatolik: {e}")
+                    self._delete(chat_id, [message_id], delete_reason, user_id, matched)
                 return
 
-            # Media guruh bo‘lsa, keyinchalik tekshirish uchun ro‘yxatga qo‘shamiz
+            # Media guruh bo‘lsa, keyingi elementlar uchun eslab qolamiz
             elif media_group_id:
-                await self.schedule_media_group_check(context, chat_id, media_group_id, message_id, delete_required=False)
+                self.media_groups.add(chat_id, media_group_id, message_id, delete_required=False)
 
         except Exception as e:
-            logger.error(f"Xabarni tekshirishda umumiy xatolik (Msg ID: {message_id}): {e}", exc_info=True)
-
-    async def schedule_media_group_check(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, media_group_id: str, message_id: int, delete_required: bool):
-        job_name = f"media_group_{chat_id}_{media_group_id}"
-        if media_group_id not in self.media_group_cache:
-            self.media_group_cache[media_group_id] = {
-                'chat_id': chat_id,
-                'message_ids': set(),
-                'delete_required': False,
-                'job_scheduled': False
-            }
-            logger.info(f"Yangi media guruh keshi yaratildi: {media_group_id}")
-
-        group_data = self.media_group_cache[media_group_id]
-        group_data['message_ids'].add(message_id)
-        if delete_required:
-            group_data['delete_required'] = True
-            logger.info(f"Media guruh ({media_group_id}) uchun o'chirish bayrog'i o'rnatildi.")
-
-        if not group_data['job_scheduled']:
-            context.job_queue.run_once(
-                self.process_media_group,
-                when=timedelta(seconds=2),
-                data={'chat_id': chat_id, 'media_group_id': media_group_id},
-                name=job_name
-            )
-            group_data['job_scheduled'] = True
-            logger.info(f"Media guruh ({media_group_id}) uchun tekshirish {job_name} nomi bilan rejalashtirildi.")
-
-    async def process_media_group(self, context: ContextTypes.DEFAULT_TYPE):
-        job_data = context.job.data
-        chat_id = job_data['chat_id']
-        media_group_id = job_data['media_group_id']
-        logger.info(f"Media guruh ({media_group_id}) ni qayta ishlash boshlandi.")
-
-        if media_group_id in self.media_group_cache:
-            group_data = self.media_group_cache[media_group_id]
-            message_ids_to_delete = list(group_data['message_ids'])
-
-            if group_data['delete_required']:
-                logger.warning(f"Media guruh ({media_group_id}) o‘chirilmoqda. Xabarlar: {message_ids_to_delete}")
-                deleted_count = 0
-                for msg_id in message_ids_to_delete:
-                    try:
-                        await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                        deleted_count += 1
-                        await asyncio.sleep(0.1)
-                    except Exception as e:
-                        logger.error(f"Media guruh xabarini (ID: {msg_id}) o‘chirishda xato: {e}")
-                logger.info(f"Media guruh ({media_group_id}) dan {deleted_count}/{len(message_ids_to_delete)} xabar o‘chirildi.")
-            else:
-                logger.info(f"Media guruh ({media_group_id}) uchun o'chirish talab qilinmagan.")
-
-            del self.media_group_cache[media_group_id]
-            logger.info(f"Media guruh ({media_group_id}) keshdan tozalandi.")
-        else:
-            logger.warning(f"process_media_group chaqirildi, lekin media guruh ({media_group_id}) keshda topilmadi.")
+            metrics.inc('moderator_check_errors_total')
+            logger.error("Xabarni tekshirishda umumiy xatolik (Msg ID: %s): %s", message_id, e, exc_info=True)
+        finally:
+            metrics.observe('moderator_stage_seconds', time.perf_counter() - started, stage='total')
 
     @owner_only
     async def add_offensive_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -334,10 +2158,14 @@ class TelegramModerator:
             await update.message.reply_text("Iltimos, so'zni kiriting. Masalan: /addword yomon")
             return
         word = " ".join(context.args).lower().strip()
-        result = self.word_manager.add_word(word)
+        canonical = normalize_text(word)
+        if canonical and self.A.exists(canonical):
+            await update.message.reply_text(f"ℹ️ '{word}' allaqachon '{canonical}' kanonik shakli orqali aniqlanadi.")
+            return
+        result = await self.word_manager.run(self.word_manager.add_word, word)
         if result == "added":
+            await self._apply_word_edit()
             await update.message.reply_text(f"✅ '{word}' haqoratli so'zlar ro'yxatiga qo'shildi!")
-            self._rebuild_automaton()
         elif result == "exists":
             await update.message.reply_text(f"ℹ️ '{word}' bu so'z avval qo'shilgan.")
         elif result == "error":
@@ -349,51 +2177,77 @@ class TelegramModerator:
             await update.message.reply_text("Iltimos, o'chirish kerak bo'lgan so'zni kiriting. Masalan: /removeword yomon")
             return
         word = " ".join(context.args).lower().strip()
-        result = self.word_manager.remove_word(word)
+        result = await self.word_manager.run(self.word_manager.remove_word, word)
         if result == "removed":
+            await self._apply_word_edit()
             await update.message.reply_text(f"✅ '{word}' haqoratli so'zlar ro'yxatidan o'chirildi!")
-            self._rebuild_automaton()
         elif result == "not_found":
             await update.message.reply_text(f"ℹ️ '{word}' so'z ro'yxatda mavjud emas.")
         elif result == "error":
             await update.message.reply_text(f"❌ '{word}' so'zini o'chirishda xatolik yuz berdi.")
 
+    @strict_owner_only
+    async def import_offensive_words(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        replied = update.message.reply_to_message
+        document = replied.document if replied else None
+        if not document:
+            await update.message.reply_text("Iltimos, so'zlar yozilgan .txt faylga javob sifatida /importwords yuboring (har qatorda bitta so'z).")
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+            await update.message.reply_text(f"❌ Fayl juda katta (maksimal {IMPORT_MAX_BYTES // 1024} KB).")
+            return
+        try:
+            file = await document.get_file()
+            content = (await file.download_as_bytearray()).decode('utf-8-sig')
+        except UnicodeDecodeError:
+            await update.message.reply_text("❌ Fayl UTF-8 formatida bo'lishi kerak.")
+            return
+        except Exception as e:
+            logger.error(f"Import faylini yuklab olishda xatolik: {e}")
+            await update.message.reply_text("❌ Faylni yuklab olishda xatolik yuz berdi.")
+            return
+
+        words = {line.lower().strip() for line in content.splitlines()}
+        words.discard('')
+        added = await self.word_manager.run(self.word_manager.add_words, words)
+        if added > 0:
+            await self._apply_word_edit()
+        if added < 0:
+            await update.message.reply_text("❌ So'zlarni import qilishda xatolik yuz berdi.")
+            return
+        logger.info(f"Import: {len(words)} ta so'zdan {added} tasi qo'shildi.")
+        await update.message.reply_text(f"✅ Import yakunlandi: {added} ta yangi so'z qo'shildi, {len(words) - added} tasi avval mavjud edi.")
+
     @owner_only
-    async def show_offensive_words(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page=None):
+    async def show_offensive_words(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page=None, after_id=None, before_id=None):
         message_or_query = update.callback_query.message if update.callback_query else update.message
         logger.info("show_offensive_words funksiyasi chaqirildi")
-        offensive_words = self.word_manager.get_words()
-        word_count = len(offensive_words)
+        word_count = await self.word_manager.run(self.word_manager.word_count)
+        rows, has_prev, has_next = await self.word_manager.run(
+            self.word_manager.get_words_page, self.words_per_page, after_id, before_id
+        )
 
-        if not offensive_words:
+        if not rows:
             await message_or_query.reply_text("Haqoratli so'zlar ro'yxati bo'sh.")
             return
 
-        total_pages = (word_count + self.words_per_page - 1) // self.words_per_page
+        # Sahifalar oxiridan hisoblanadi: birinchi /showwords eng yangi so'zlarni ko'rsatadi
+        total_pages = max(1, (word_count + self.words_per_page - 1) // self.words_per_page)
         if page is None:
-            if not update.callback_query:
-                page = max(0, total_pages - 1)
-            else:
-                page = 0
-        else:
-            page = max(0, min(page, total_pages - 1))
-
-        start_idx = page * self.words_per_page
-        end_idx = min(start_idx + self.words_per_page, word_count)
-        page_words = offensive_words[start_idx:end_idx]
+            page = total_pages - 1
+        page = max(0, min(page, total_pages - 1))
+        page_words = [word for _, word in rows]
+        first_id, last_id = rows[0][0], rows[-1][0]
 
         message_text = f"Haqoratli so'zlar ro'yxati ({page + 1}/{total_pages} sahifa, Jami: {word_count}):\n"
-        if page_words:
-            message_text += "```\n" + "\n".join(page_words) + "\n```"
-        else:
-            message_text += "_Bu sahifada so'zlar yo'q._"
+        message_text += "```\n" + "\n".join(page_words) + "\n```"
 
         keyboard_buttons = []
         row = []
-        if page > 0:
-            row.append(InlineKeyboardButton("⏪ Avvalgi", callback_data=f"prev_{page-1}"))
-        if page < total_pages - 1:
-            row.append(InlineKeyboardButton("Keyingi ⏩", callback_data=f"next_{page+1}"))
+        if has_prev:
+            row.append(InlineKeyboardButton("⏪ Avvalgi", callback_data=f"prev_{page-1}_{first_id}"))
+        if has_next:
+            row.append(InlineKeyboardButton("Keyingi ⏩", callback_data=f"next_{page+1}_{last_id}"))
         if row:
             keyboard_buttons.append(row)
 
@@ -418,6 +2272,21 @@ class TelegramModerator:
                 logger.error(f"Oddiy tekstda ham yuborishda xatolik: {fallback_e}")
                 await message_or_query.reply_text("❌ Ro'yxatni ko'rsatishda xatolik yuz berdi.")
 
+    @strict_owner_only
+    async def search_offensive_words(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not context.args:
+            await update.message.reply_text("Iltimos, qidiriladigan so'z boshini kiriting. Masalan: /searchword yom")
+            return
+        prefix = " ".join(context.args).lower().strip()
+        words = await self.word_manager.run(self.word_manager.search_words, prefix, self.words_per_page + 1)
+        if not words:
+            await update.message.reply_text(f"ℹ️ '{prefix}' bilan boshlanadigan so'z topilmadi.")
+            return
+        text = f"'{prefix}' bilan boshlanadigan so'zlar:\n" + "\n".join(words[:self.words_per_page])
+        if len(words) > self.words_per_page:
+            text += f"\n... (faqat birinchi {self.words_per_page} tasi ko'rsatildi, qidiruvni aniqlashtiring)"
+        await update.message.reply_text(text)
+
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
@@ -425,13 +2294,202 @@ class TelegramModerator:
         logger.info(f"Callback query olindi: {data}")
 
         try:
-            action, page_str = data.split("_")
+            action, page_str, cursor_str = data.split("_")
             current_page = int(page_str)
-            if action in ["prev", "next"]:
-                await self.show_offensive_words(update, context, page=current_page)
+            cursor_id = int(cursor_str)
+            if action == "prev":
+                await self.show_offensive_words(update, context, page=current_page, before_id=cursor_id)
+            elif action == "next":
+                await self.show_offensive_words(update, context, page=current_page, after_id=cursor_id)
         except Exception as e:
             logger.error(f"Callback query'ni ({data}) qayta ishlashda xato: {e}", exc_info=True)
 
+    @strict_owner_only
+    async def cache_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        stats = self.member_cache.stats()
+        verdict_stats = self.verdict_cache.stats()
+        await update.message.reply_text(
+            f"A'zolik statusi keshi:\n"
+            f"Hajmi: {stats['size']}\n"
+            f"Hit: {stats['hits']}\n"
+            f"Miss (get_chat_member): {stats['misses']}\n"
+            f"Hit rate: {stats['hit_rate']:.1f}%\n\n"
+            f"Natijalar (verdict) keshi:\n"
+            f"Hajmi: {verdict_stats['size']}\n"
+            f"Hit: {verdict_stats['hits']}\n"
+            f"Miss: {verdict_stats['misses']}\n"
+            f"Hit rate: {verdict_stats['hit_rate']:.1f}%"
+        )
+
+    @strict_owner_only
+    async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        lines = ["📊 Statistika"]
+        checked = sum(metrics.counters.get('moderator_messages_checked_total', {}).values())
+        lines.append(f"Tekshirilgan xabarlar: {checked}")
+        lines.append("\nBosqichlar (p50 / p99 / soni):")
+        for stage in ('total', 'member_status', 'flood', 'offensive_scan', 'link_scan'):
+            histogram = metrics.histogram('moderator_stage_seconds', stage=stage)
+            if histogram and histogram.count:
+                lines.append(
+                    f"  {stage}: ≤{histogram.quantile(0.5) * 1000:g} ms / ≤{histogram.quantile(0.99) * 1000:g} ms / {histogram.count}"
+                )
+        lines.append("\nO‘chirish sabablari:")
+        for labels, value in sorted(metrics.counters.get('moderator_deletions_total', {}).items(), key=lambda item: -item[1]):
+            lines.append(f"  {dict(labels)['reason']}: {value}")
+        top_chats = sorted(metrics.counters.get('moderator_deletions_by_chat_total', {}).items(), key=lambda item: -item[1])[:10]
+        if top_chats:
+            lines.append("\nEng ko‘p o‘chirilgan chatlar:")
+            for labels, value in top_chats:
+                lines.append(f"  {dict(labels)['chat_id']}: {value}")
+        api_errors = metrics.counters.get('moderator_api_errors_total', {})
+        retries = sum(metrics.counters.get('moderator_api_retries_total', {}).values())
+        lines.append(f"\nAPI xatolari: {sum(api_errors.values())}, qayta urinishlar: {retries}")
+        member_stats = self.member_cache.stats()
+        lines.append(f"A'zolik keshi: {member_stats['size']} ta, hit rate {member_stats['hit_rate']:.1f}%")
+        verdict_stats = self.verdict_cache.stats()
+        lines.append(f"Natijalar keshi: {verdict_stats['size']} ta, hit rate {verdict_stats['hit_rate']:.1f}%")
+        lines.append(f"Automaton: {len(self.A)} kanonik so'z (versiya {self.automaton_version})")
+        if self.fuzzy_index is not None:
+            lines.append(f"Fuzzy indeks: {self.fuzzy_index.words} so'z, {len(self.fuzzy_index)} kalit (masofa {self.fuzzy_index.max_distance})")
+        lines.append(f"Media guruhlar keshi: {len(self.media_groups)} ta")
+        lines.append(f"Chat qoidalari keshi: {len(self.chat_policies)} ta ({self.chat_policies.compiled_deltas()} ta delta automaton)")
+        lines.append(f"Flood nazorati: {len(self.flood)} ta foydalanuvchi, {self.flood.triggered} ta holat")
+        lines.append(f"O'chirish navbati: {len(self.actions)} ta xabar")
+        lines.append(f"Audit: {self.audit.written} ta yozilgan, buferda {len(self.audit)} ta, tashlangan {self.audit.dropped} ta")
+        await update.message.reply_text("\n".join(lines))
+
+    async def _audit_report(self, update, column, value, days, top_column, title):
+        # Bufer avval yoziladi, shunda hisobotda oxirgi o'chirishlar ham ko'rinadi
+        await self.audit.flush()
+        since = datetime.now() - timedelta(days=days)
+        by_reason, top, matched = await self.word_manager.run(
+            self.word_manager.audit_summary, column, value, since, top_column
+        )
+        total = sum(count for _, count in by_reason)
+        lines = [f"{title} (oxirgi {days} kun): {total} ta xabar o'chirilgan"]
+        if by_reason:
+            lines.append("\nSabablar:")
+            lines.extend(f"  {reason}: {count}" for reason, count in by_reason)
+        if top:
+            lines.append("\nFoydalanuvchilar:" if top_column == 'user_id' else "\nChatlar:")
+            lines.extend(f"  {key}: {count}" for key, count in top)
+        if matched:
+            lines.append("\nTopilgan so'zlar/fayllar:")
+            lines.extend(f"  {word}: {count}" for word, count in matched)
+        await update.message.reply_text("\n".join(lines))
+
+    @staticmethod
+    def _parse_audit_args(args, default_id=None):
+        # [id] [kun]. Guruhda id berilmasa (yoki yagona musbat son - kunlar soni) joriy chat olinadi;
+        # guruh id'lari manfiy bo'lgani uchun ular kunlar sonidan ajraladi
+        try:
+            values = [int(arg) for arg in args]
+        except ValueError:
+            return None, None
+        if default_id is not None and len(values) < 2 and not (values and values[0] < 0):
+            return default_id, values[0] if values else 7
+        if not values:
+            return None, None
+        return values[0], values[1] if len(values) > 1 else 7
+
+    @strict_owner_only
+    async def audit_chat(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        current = update.effective_chat.id if update.effective_chat.type != Chat.PRIVATE else None
+        chat_id, days = self._parse_audit_args(context.args, current)
+        if chat_id is None or days <= 0:
+            await update.message.reply_text("Foydalanish: /auditchat [chat_id] [kunlar soni, standart 7]")
+            return
+        await self._audit_report(update, 'chat_id', chat_id, days, 'user_id', f"Chat {chat_id}")
+
+    @strict_owner_only
+    async def audit_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id, days = self._parse_audit_args(context.args)
+        if user_id is None or days <= 0:
+            await update.message.reply_text("Foydalanish: /audituser [user_id] [kunlar soni, standart 7]")
+            return
+        await self._audit_report(update, 'user_id', user_id, days, 'chat_id', f"Foydalanuvchi {user_id}")
+
+    @chat_admin_only
+    async def chat_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if len(context.args) < 2 or context.args[0] not in ('add', 'exclude', 'remove'):
+            await update.message.reply_text(
+                "Foydalanish: /chatword add|exclude|remove [so‘z]\n"
+                "add - faqat shu guruhda taqiqlash, exclude - global ro‘yxatdagi so‘zga shu guruhda ruxsat berish"
+            )
+            return
+        chat_id = update.effective_chat.id
+        action = context.args[0]
+        word = " ".join(context.args[1:]).lower().strip()
+        if action == 'remove':
+            result = await self.word_manager.run(self.word_manager.remove_chat_word, chat_id, word)
+        else:
+            result = await self.word_manager.run(self.word_manager.set_chat_word, chat_id, word, action)
+        if result in ("added", "removed"):
+            self.chat_policies.invalidate(chat_id)
+            logger.info(f"Chat ({chat_id}) so'zi yangilandi: {action} '{word}'")
+            await update.message.reply_text(f"✅ '{word}' uchun guruh qoidasi yangilandi ({action}).")
+        elif result == "exists":
+            await update.message.reply_text(f"ℹ️ '{word}' uchun bu qoida avval qo'shilgan.")
+        elif result == "not_found":
+            await update.message.reply_text(f"❌ '{word}' bu guruh qoidalarida topilmadi.")
+        else:
+            await update.message.reply_text(f"❌ '{word}' qoidasini saqlashda xatolik yuz berdi.")
+
+    @chat_admin_only
+    async def set_policy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        usage = (
+            "Foydalanish:\n"
+            "/setpolicy links youtube.com,t.me/kanal | default\n"
+            "/setpolicy files .apk,.exe | none | default\n"
+            "/setpolicy stories on|off|default\n"
+            "/setpolicy mentions on|off|default"
+        )
+        if len(context.args) != 2:
+            await update.message.reply_text(usage)
+            return
+        chat_id = update.effective_chat.id
+        option, value = context.args[0].lower(), context.args[1].lower()
+        if value == 'default':
+            stored = None
+        elif option == 'links':
+            stored = ','.join(link.strip() for link in value.split(',') if link.strip())
+        elif option == 'files':
+            stored = '' if value == 'none' else ','.join(
+                '.' + ext.strip().lstrip('.') for ext in value.split(',') if ext.strip().lstrip('.')
+            )
+        elif option in ('stories', 'mentions') and value in ('on', 'off'):
+            stored = int(value == 'on')
+        else:
+            await update.message.reply_text(usage)
+            return
+        field = {
+            'links': 'allowed_links', 'files': 'blocked_extensions',
+            'stories': 'block_stories', 'mentions': 'block_mentions',
+        }.get(option)
+        if field is None:
+            await update.message.reply_text(usage)
+            return
+        if await self.word_manager.run(self.word_manager.set_chat_policy, chat_id, field, stored):
+            self.chat_policies.invalidate(chat_id)
+            logger.info(f"Chat ({chat_id}) sozlamasi yangilandi: {field} = {stored!r}")
+            await update.message.reply_text(f"✅ Guruh sozlamasi yangilandi: {option} = {value}")
+        else:
+            await update.message.reply_text("❌ Sozlamani saqlashda xatolik yuz berdi.")
+
+    @chat_admin_only
+    async def show_policy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        policy = await self._get_chat_policy(update.effective_chat.id)
+        links = ', '.join(policy.allowed_links) if policy.allowed_links is not None else f"standart ({', '.join(ALLOWED_LINKS)})"
+        await update.message.reply_text(
+            f"Guruh qoidalari:\n"
+            f"Ruxsat etilgan havolalar: {links or 'yo‘q'}\n"
+            f"Taqiqlangan fayllar: {', '.join(policy.blocked_extensions) or 'yo‘q'}\n"
+            f"Story’lar o‘chiriladi: {'ha' if policy.block_stories else 'yo‘q'}\n"
+            f"Mention’lar o‘chiriladi: {'ha' if policy.block_mentions else 'yo‘q'}\n"
+            f"Qo‘shimcha so‘zlar: {len(policy.extra_words)} ta\n"
+            f"Ruxsat berilgan global so‘zlar: {len(policy.excluded)} ta"
+        )
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         if update.effective_chat.type == Chat.PRIVATE and user_id != OWNER_ID:
@@ -442,11 +2500,18 @@ class TelegramModerator:
                 f"Mavjud buyruqlar:\n"
                 f"/addword [so‘z] - haqoratli so‘z qo‘shish\n"
                 f"/removeword [so‘z] - haqoratli so‘zni o‘chirish\n"
-                f"/showwords - haqoratli so‘zlar ro‘yxati"
+                f"/importwords - .txt faylga javob qilib, so‘zlarni ommaviy qo‘shish\n"
+                f"/showwords - haqoratli so‘zlar ro‘yxati\n"
+                f"/searchword [boshi] - so‘zlarni boshlanishi bo‘yicha qidirish\n"
+                f"/cachestats - a'zolik va natijalar keshi statistikasi\n"
+                f"/stats - moderatsiya statistikasi va kechikishlar\n"
+                f"/auditchat [chat_id] [kun] - chat bo‘yicha o‘chirishlar hisoboti\n"
+                f"/audituser [user_id] [kun] - foydalanuvchi bo‘yicha o‘chirishlar hisoboti"
             )
         else:
             await update.message.reply_text(
-                "Salom! Men guruhingizni haqoratli so‘zlar, ruxsatsiz havolalar va APK fayllardan tozalashga yordam beraman."
+                "Salom! Men guruhingizni haqoratli so‘zlar, ruxsatsiz havolalar va APK fayllardan tozalashga yordam beraman.\n"
+                "Guruh adminlari uchun: /policy, /setpolicy, /chatword"
             )
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -457,18 +2522,60 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Xato xabarini yuborishda xatolik: {e}")
 
+async def post_init(application: Application):
+    if METRICS_PORT:
+        application.bot_data['metrics_server'] = await start_metrics_server()
+
+async def post_stop(application: Application):
+    moderator = application.bot_data.get('moderator')
+    if moderator:
+        # Bot yopilishidan oldin navbatdagi o'chirishlarni yakunlaymiz va audit buferini yozamiz
+        await moderator.actions.close()
+        written = await moderator.audit.flush()
+        logger.info(f"Audit buferi yozildi: {written} ta yozuv.")
+
+async def post_shutdown(application: Application):
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    moderator = application.bot_data.get('moderator')
+    if moderator:
+        moderator.word_manager.close()
+        logger.info("Ma'lumotlar bazasi ulanishi yopildi.")
+
 # main funksiyasida:
 def main():
     logging.info("Bot ishga tushirilmoqda...")
     try:
-        application = Application.builder().token(TOKEN).job_queue(JobQueue()).build()
+        builder = (
+            Application.builder().token(TOKEN).job_queue(JobQueue())
+            .post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown)
+        )
+        if UPDATE_CONCURRENCY > 1:
+            builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        application = builder.build()
         moderator = TelegramModerator(TOKEN, application)
+        application.bot_data['moderator'] = moderator
 
         application.add_handler(CommandHandler('start', moderator.start_command))
         application.add_handler(CommandHandler('addword', moderator.add_offensive_word))
         application.add_handler(CommandHandler('removeword', moderator.remove_offensive_word))
+        application.add_handler(CommandHandler('importwords', moderator.import_offensive_words))
         application.add_handler(CommandHandler('showwords', moderator.show_offensive_words))
+        application.add_handler(CommandHandler('searchword', moderator.search_offensive_words))
+        application.add_handler(CommandHandler('cachestats', moderator.cache_stats))
+        application.add_handler(CommandHandler('stats', moderator.show_stats))
+        application.add_handler(CommandHandler('chatword', moderator.chat_word))
+        application.add_handler(CommandHandler('setpolicy', moderator.set_policy))
+        application.add_handler(CommandHandler('policy', moderator.show_policy))
+        application.add_handler(CommandHandler('auditchat', moderator.audit_chat))
+        application.add_handler(CommandHandler('audituser', moderator.audit_user))
+        application.job_queue.run_repeating(moderator.flush_audit, interval=AUDIT_FLUSH_INTERVAL, first=AUDIT_FLUSH_INTERVAL)
+        if WORD_SYNC_INTERVAL > 0:
+            application.job_queue.run_repeating(moderator.poll_word_changes, interval=WORD_SYNC_INTERVAL, first=WORD_SYNC_INTERVAL)
         application.add_handler(CallbackQueryHandler(moderator.button_handler))
+        application.add_handler(ChatMemberHandler(moderator.track_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER))
 
         message_filters = (
             filters.TEXT | filters.CAPTION | filters.PHOTO | filters.VIDEO | filters.AUDIO |
@@ -480,8 +2587,23 @@ def main():
         # Xato handlerini qo‘shish
         application.add_error_handler(error_handler)
 
-        logging.info("Bot polling rejimida ishga tushdi.")
-        application.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == 'webhook':
+            # python-telegram-bot[webhooks] (tornado) o'rnatilgan bo'lishi kerak
+            if not WEBHOOK_URL:
+                raise ValueError("Webhook rejimi uchun WEBHOOK_URL berilishi kerak.")
+            logging.info(f"Bot webhook rejimida ishga tushdi ({WEBHOOK_LISTEN}:{WEBHOOK_PORT}, parallel: {UPDATE_CONCURRENCY}).")
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET or None,
+                drop_pending_updates=DROP_PENDING_UPDATES,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            logging.info(f"Bot polling rejimida ishga tushdi (parallel: {UPDATE_CONCURRENCY}).")
+            application.run_polling(drop_pending_updates=DROP_PENDING_UPDATES, allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logging.critical(f"Botni ishga tushirishda kritik xatolik: {e}", exc_info=True)
 if __name__ == '__main__':
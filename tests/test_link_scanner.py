@@ -0,0 +1,129 @@
+# LinkScanner va eski link_pattern/mention_pattern regexlarining qarorlarini solishtirish.
+#
+#   python -m pytest -q tests/test_link_scanner.py
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+from telegram import Update
+
+# main3 import paytida log faylini ochadi - testlar repodagi bot.log'ga yozmasligi kerak
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.mkdtemp(prefix='moderator_test_'), 'bot.log'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main3  # noqa: E402
+
+# Oldingi versiyadagi tekshiruv (TelegramModerator._contains_disallowed_content), o'zgarishsiz
+OLD_LINK_PATTERN = re.compile(
+    r'http[s]?://(?!.*(?:youtube\.com/watch|youtu\.be/|youtube\.com/shorts|m\.youtube\.com))[a-zA-Z0-9./?=&-_%]+' +
+    r'|' +
+    r'www\.(?!.*(?:youtube\.com/watch|youtu\.be/|youtube\.com/shorts|m\.youtube\.com))[a-zA-Z0-9./?=&-_%]+',
+    re.IGNORECASE
+)
+OLD_MENTION_PATTERN = re.compile(r'@[\w]{5,}')
+OLD_ALLOWED_DOMAINS = ['youtube.com/watch', 'youtu.be/', 'youtube.com/shorts', 'm.youtube.com']
+
+
+def old_verdict(text, message):
+    text_lower = text.lower()
+    if OLD_LINK_PATTERN.search(text_lower):
+        return "link"
+    if OLD_MENTION_PATTERN.search(text_lower):
+        return "mention"
+    for entity in message.entities or message.caption_entities or []:
+        if entity.type == 'url':
+            url = text[entity.offset: entity.offset + entity.length].lower()
+            if not any(domain in url for domain in OLD_ALLOWED_DOMAINS):
+                return "link"
+        elif entity.type == 'text_link':
+            if not any(domain in entity.url.lower() for domain in OLD_ALLOWED_DOMAINS):
+                return "link"
+    return None
+
+
+def new_verdict(text, message):
+    scanner = main3.LinkScanner()
+    if scanner.find_disallowed_entity(message):
+        return "link"
+    return scanner.scan(text)
+
+
+_ENTITY_URL_PATTERN = re.compile(r'(?:https?://|www\.)\S+|\b[a-z0-9-]+\.(?:com|uz|me|be|ru)(?:/\S*)?', re.IGNORECASE)
+
+
+def utf16_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def url_entities(text):
+    # Telegram kabi: offset va length UTF-16 kod birliklarida
+    return [
+        {'type': 'url', 'offset': utf16_length(text[:match.start()]), 'length': utf16_length(match.group())}
+        for match in _ENTITY_URL_PATTERN.finditer(text)
+    ]
+
+
+def make_message(text, entities=None):
+    data = {'message_id': 1, 'date': 0, 'chat': {'id': -100, 'type': 'supergroup'}, 'text': text}
+    if entities:
+        data['entities'] = entities
+    return Update.de_json({'update_id': 1, 'message': data}, None).message
+
+
+CORPUS = [
+    # oddiy matn
+    "salom hammaga", "ertaga dars soat 9 da", "awww.cute", "www.", "http://", "salom @ user",
+    # YouTube
+    "https://youtube.com/watch?v=abc", "https://www.youtube.com/watch?v=abc", "https://youtu.be/xyz",
+    "youtu.be/xyz zo'r video", "https://m.youtube.com/anything", "https://youtube.com/shorts/1",
+    "www.youtube.com/watch?v=1", "https://youtu.be", "https://youtube.com/channel/x",
+    "https://music.youtube.com/watch?v=1", "qara: https://www.youtube.com/shorts/abc va https://youtu.be/q",
+    # ruxsatsiz havolalar, aralash registr
+    "http://evil.com/x", "WWW.EVIL.COM", "Havola: HTTPS://Spam.uz/promo", "https://t.me/joinchat/abc",
+    "t.me/spam", "ha www.t.me", "HtTpS://YouTube.com/Watch?v=1", "HTTPS://YOUTU.BE/ABC",
+    # mention
+    "kanalga obuna bo'ling @mychannel", "@abc qisqa", "email: foo@gmail.com",
+    "https://youtube.com/watch?v=1 @channel_name",
+    # UTF-16 (emoji) bilan
+    "🙂 https://evil.com", "🙂 https://youtu.be/abc", "👍🏻 salom spam.uz", "line1\nhttps://youtu.be/a\nhttps://ok.youtube.com/watch",
+]
+
+# Ataylab o'zgartirilgan qarorlar: (matn, entity bilanmi) -> yangi qaror
+INTENDED_DIFFERENCES = {
+    # Eski lookahead butun qatorni o'qirdi: keyinroq YouTube havolasi bo'lsa, ruxsatsiz havola o'tib ketardi
+    ("https://evil.com/x https://youtu.be/a", False): "link",
+    # Eski kod UTF-16 offsetlarni Python indeksi sifatida ishlatardi: emoji'dan keyingi YouTube havolasi
+    # noto'g'ri kesilib, ruxsatsiz deb o'chirilardi
+    ("🙂🙂 salom youtube.com/watch?v=1", True): None,
+    # Entity'lar matndan oldin tekshiriladi: bare-domain entity mention'dan oldin topiladi (eski: "mention")
+    ("email: foo@gmail.com", True): "link",
+}
+
+
+@pytest.mark.parametrize('with_entities', [False, True])
+@pytest.mark.parametrize('text', CORPUS)
+def test_same_verdict_as_old_regex(text, with_entities):
+    message = make_message(text, url_entities(text) if with_entities else None)
+    expected = INTENDED_DIFFERENCES.get((text, with_entities), old_verdict(text, message))
+    assert new_verdict(text, message) == expected
+
+
+@pytest.mark.parametrize('url, expected', [
+    ("https://evil.com/promo", "link"),
+    ("https://www.youtube.com/watch?v=1", None),
+    ("https://YouTu.be/abc", None),
+])
+def test_text_link_entity(url, expected):
+    text = "bu yerda"
+    message = make_message(text, [{'type': 'text_link', 'offset': 0, 'length': 2, 'url': url}])
+    assert new_verdict(text, message) == expected
+    assert old_verdict(text, message) == expected
+
+
+@pytest.mark.parametrize('text, with_entities', list(INTENDED_DIFFERENCES))
+def test_intended_differences(text, with_entities):
+    message = make_message(text, url_entities(text) if with_entities else None)
+    expected = INTENDED_DIFFERENCES[(text, with_entities)]
+    assert new_verdict(text, message) == expected
+    assert old_verdict(text, message) != expected
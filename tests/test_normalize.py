@@ -0,0 +1,65 @@
+# normalize_text va normalize_with_offsets: bir xil natija, variantlarni birlashtirish, qo'sh harflar.
+#
+#   python -m pytest -q tests/test_normalize.py
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+# main3 import paytida log faylini ochadi - testlar repodagi bot.log'ga yozmasligi kerak
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.mkdtemp(prefix='moderator_test_'), 'bot.log'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main3 import normalize_text, normalize_with_offsets  # noqa: E402
+
+TRICKY = [
+    "ΣΣ yomon", "ΟΔΟΣ", "οδος Σ", "İstanbul", "İİ", "ẞ straße",
+    "yo​mon", "y­omon﻿", "‍‍", "aaa___bb", "yomooooon", "qo'yyy", "ΣΣΣσσς",
+    "ꞴꞴꞴ", "ﬁﬁﬁ", "", "ｙｏｍｏｎ", "0000", "🙂🙂🙂 yomon",
+]
+
+
+def check_offsets(text):
+    normalized, offsets = normalize_with_offsets(text)
+    assert normalized == normalize_text(text)
+    assert len(offsets) == len(normalized)
+    assert offsets == sorted(offsets)
+    assert all(0 <= offset < len(text) for offset in offsets)
+
+
+@pytest.mark.parametrize('text', TRICKY)
+def test_offsets_match_normalize_text(text):
+    check_offsets(text)
+
+
+def test_offsets_match_normalize_text_random():
+    rng = random.Random(42)
+    alphabet = "ΣσςİiIaAsS0135$@ёЁЎўқҚ​­́ßﬁ 'ʻ‘"
+    for _ in range(20000):
+        check_offsets(''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))))
+
+
+@pytest.mark.parametrize('variant, canonical', [
+    # kirill -> lotin
+    ("ЁМОН", "yomon"), ("яхши", "yaxshi"), ("ўзбек", "o'zbek"), ("қиз", "qiz"),
+    # leetspeak
+    ("y0m0n", "yomon"), ("4hm0q", "ahmoq"), ("$uka", "suka"), ("@hm0q", "ahmoq"),
+    # homogliflar, fullwidth, diakritika, apostrof variantlari
+    ("yоmоn", "yomon"), ("αhmοq", "ahmoq"), ("ｙｏｍｏｎ", "yomon"), ("yómón", "yomon"),
+    ("o‘zbek", "o'zbek"), ("oʻzbek", "o'zbek"),
+    # ko'rinmas belgilar va cho'zilgan harflar
+    ("yo​mon", "yomon"), ("yomooooon", "yomon"), ("YOMONNN", "yomon"),
+])
+def test_variants_fold_to_canonical(variant, canonical):
+    assert normalize_text(variant) == canonical
+
+
+@pytest.mark.parametrize('word', ["katta", "ammo", "ikki", "pass", "tonna", "singillar", "ovozni pas qil"])
+def test_double_letters_are_kept(word):
+    assert normalize_text(word) == word
+
+
+def test_stretched_and_double_letters_stay_distinct():
+    assert normalize_text("pas") != normalize_text("pass")
+    assert normalize_text("katttta") == "kata"